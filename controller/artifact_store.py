@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store for screenshots, UI dumps and other capture artifacts.
+
+Features
+- Hash every blob (SHA-256) and store it once under ``objects/<aa>/<digest>``,
+  so repeated identical screenshots/dumps cost a hash instead of a write.
+- Compress text artifacts (XML/JSON/CSV) with zstd when ``zstandard`` is
+  installed, otherwise deflate; PNG/WebP are stored as-is.
+- Keep named entries (``<namespace>/<file name>``) as small JSON references under
+  ``refs/`` that point at the object digest.
+- Garbage-collect by age and/or total size, then sweep unreferenced objects.
+  Objects written or reused within ``GC_GRACE_SECONDS`` are never swept, so a
+  capture running alongside ``gc`` keeps its blobs.
+
+The default root is ``/work/artifacts`` so the store lives on the bind-mounted
+volume next to the other capture outputs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+DEFAULT_STORE = Path("/work/artifacts")
+COMPRESSIBLE_SUFFIXES = {".xml", ".json", ".csv", ".txt"}
+CODEC_EXTENSIONS = {"none": "", "zstd": ".zst", "deflate": ".z"}
+GC_GRACE_SECONDS = 600.0
+SIZE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([kmgt]?)b?$", re.IGNORECASE)
+
+
+class StoreError(RuntimeError):
+    pass
+
+
+@dataclass
+class ArtifactRef:
+    name: str
+    digest: str
+    size: int
+    stored_size: int
+    codec: str
+    created: float
+
+
+@dataclass
+class GcResult:
+    refs_removed: int
+    objects_removed: int
+    bytes_freed: int
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "deflate"
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise StoreError("zstd codec requested but the 'zstandard' module is not installed.")
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    if codec == "deflate":
+        return zlib.compress(data, 6)
+    return data
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise StoreError("Object is zstd-compressed but the 'zstandard' module is not installed.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "deflate":
+        return zlib.decompress(data)
+    return data
+
+
+def parse_size(value: str) -> int:
+    match = SIZE_PATTERN.match(value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {value} (use e.g. 500M or 2G)")
+    number, unit = match.groups()
+    exponent = "kmgt".find(unit.lower()) + 1 if unit else 0
+    return int(float(number) * 1024**exponent)
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    except FileNotFoundError:
+        # A concurrent gc removed the (empty) directory between mkdir and mkstemp.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+class ArtifactStore:
+    def __init__(self, root: Path = DEFAULT_STORE, codec: Optional[str] = None) -> None:
+        self.root = Path(root)
+        self.codec = codec or default_codec()
+        if self.codec not in CODEC_EXTENSIONS:
+            raise StoreError(f"Unknown codec: {self.codec}")
+        self.objects_dir = self.root / "objects"
+        self.refs_dir = self.root / "refs"
+
+    # ---- objects ----
+
+    def object_path(self, digest: str, codec: str) -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}{CODEC_EXTENSIONS[codec]}"
+
+    def _existing_object(self, digest: str) -> Optional[tuple[Path, str]]:
+        for codec in CODEC_EXTENSIONS:
+            path = self.object_path(digest, codec)
+            if path.exists():
+                return path, codec
+        return None
+
+    # ---- refs ----
+
+    def _ref_path(self, name: str) -> Path:
+        clean = Path(name.strip("/"))
+        if not clean.parts or ".." in clean.parts:
+            raise StoreError(f"Invalid artifact name: {name}")
+        return self.refs_dir / f"{clean}.json"
+
+    def put_bytes(self, name: str, data: bytes) -> ArtifactRef:
+        digest = hashlib.sha256(data).hexdigest()
+        existing = self._existing_object(digest)
+        if existing:
+            path, codec = existing
+            os.utime(path)  # mark as recently used so a concurrent gc keeps it
+            stored_size = path.stat().st_size
+        else:
+            codec = self.codec if Path(name).suffix.lower() in COMPRESSIBLE_SUFFIXES else "none"
+            payload = compress(data, codec)
+            _write_atomic(self.object_path(digest, codec), payload)
+            stored_size = len(payload)
+
+        ref = ArtifactRef(
+            name=name.strip("/"),
+            digest=digest,
+            size=len(data),
+            stored_size=stored_size,
+            codec=codec,
+            created=time.time(),
+        )
+        _write_atomic(self._ref_path(name), json.dumps(asdict(ref)).encode("utf-8"))
+        return ref
+
+    def put_file(self, name: str, path: Path, remove: bool = False) -> ArtifactRef:
+        ref = self.put_bytes(name, path.read_bytes())
+        if remove:
+            path.unlink()
+        return ref
+
+    def get_ref(self, name: str) -> ArtifactRef:
+        ref_path = self._ref_path(name)
+        if not ref_path.exists():
+            raise StoreError(f"Artifact not found: {name}")
+        return ArtifactRef(**json.loads(ref_path.read_text(encoding="utf-8")))
+
+    def get_bytes(self, name: str) -> bytes:
+        ref = self.get_ref(name)
+        path = self.object_path(ref.digest, ref.codec)
+        if not path.exists():
+            raise StoreError(f"Object {ref.digest} for {name} is missing from the store.")
+        return decompress(path.read_bytes(), ref.codec)
+
+    def export(self, name: str, destination: Path) -> Path:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.write_bytes(self.get_bytes(name))
+        return destination
+
+    def iter_refs(self, prefix: str = "") -> Iterator[ArtifactRef]:
+        if not self.refs_dir.exists():
+            return
+        for ref_path in sorted(self.refs_dir.rglob("*.json")):
+            ref = ArtifactRef(**json.loads(ref_path.read_text(encoding="utf-8")))
+            if ref.name.startswith(prefix.strip("/")):
+                yield ref
+
+    def delete_ref(self, name: str) -> None:
+        self._ref_path(name).unlink(missing_ok=True)
+
+    # ---- garbage collection ----
+
+    def gc(
+        self,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        dry_run: bool = False,
+    ) -> GcResult:
+        """Drop refs older than `max_age` seconds, then the oldest refs until the
+        referenced objects fit in `max_bytes`, then sweep unreferenced objects
+        that have not been written or reused within the grace window."""
+        now = time.time()
+        grace_cutoff = now - GC_GRACE_SECONDS
+        refs = sorted(self.iter_refs(), key=lambda r: r.created)
+        doomed: List[ArtifactRef] = []
+        if max_age is not None:
+            doomed = [r for r in refs if now - r.created > max_age]
+            refs = [r for r in refs if now - r.created <= max_age]
+
+        if max_bytes is not None:
+            users: Dict[str, int] = {}
+            for ref in refs:
+                users[ref.digest] = users.get(ref.digest, 0) + 1
+            sizes = {r.digest: r.stored_size for r in refs}
+            total = sum(sizes.values())
+            while refs and total > max_bytes:
+                ref = refs.pop(0)
+                doomed.append(ref)
+                users[ref.digest] -= 1
+                if users[ref.digest] == 0:
+                    total -= sizes[ref.digest]
+
+        if not dry_run:
+            for ref in doomed:
+                try:
+                    current = self.get_ref(ref.name)
+                except StoreError:
+                    continue
+                if current.digest == ref.digest and current.created == ref.created:
+                    self.delete_ref(ref.name)
+
+        live = {self.object_path(r.digest, r.codec) for r in refs}
+        objects_removed = bytes_freed = 0
+        if self.objects_dir.exists():
+            for path in self.objects_dir.glob("*/*"):
+                if path in live or path.name.startswith(".tmp-"):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime >= grace_cutoff:
+                    continue
+                objects_removed += 1
+                bytes_freed += stat.st_size
+                if not dry_run:
+                    path.unlink()
+
+        if not dry_run:
+            for base in (self.refs_dir, self.objects_dir):
+                for directory in sorted(base.rglob("*"), reverse=True):
+                    try:
+                        # Recently touched directories may be about to receive a write.
+                        if not directory.is_dir() or directory.stat().st_mtime >= grace_cutoff:
+                            continue
+                        if not any(directory.iterdir()):
+                            directory.rmdir()
+                    except OSError:
+                        continue  # gone already, or written to since the check
+
+        return GcResult(len(doomed), objects_removed, bytes_freed)
+
+
+# -------------------- CLI --------------------
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Manage the content-addressed capture artifact store")
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=DEFAULT_STORE,
+        help=f"Store root (default: {DEFAULT_STORE})",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    put = sub.add_parser("put", help="Add a file under a name")
+    put.add_argument("name", help="Artifact name, e.g. ui-dumps/20240901-120000-login.xml")
+    put.add_argument("file", type=Path)
+
+    get = sub.add_parser("get", help="Write an artifact to a file (or stdout)")
+    get.add_argument("name")
+    get.add_argument("-o", "--output", type=Path)
+
+    ls = sub.add_parser("ls", help="List artifacts")
+    ls.add_argument("prefix", nargs="?", default="")
+
+    export = sub.add_parser("export", help="Materialize every artifact under a prefix into a directory")
+    export.add_argument("prefix")
+    export.add_argument("directory", type=Path)
+
+    gc = sub.add_parser("gc", help="Apply retention and remove unreferenced objects")
+    gc.add_argument("--max-age-days", type=float, help="Drop entries older than this many days")
+    gc.add_argument("--max-size", type=parse_size, help="Keep stored objects under this size (e.g. 2G)")
+    gc.add_argument("--dry-run", action="store_true", help="Report what would be removed")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    store = ArtifactStore(args.store)
+
+    try:
+        if args.command == "put":
+            ref = store.put_file(args.name, args.file)
+            print(f"{ref.name} -> {ref.digest} ({ref.size} bytes, {ref.codec})")
+        elif args.command == "get":
+            if args.output:
+                store.export(args.name, args.output)
+            else:
+                sys.stdout.buffer.write(store.get_bytes(args.name))
+        elif args.command == "ls":
+            for ref in store.iter_refs(args.prefix):
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ref.created))
+                print(f"{created}  {ref.size:>10}  {ref.digest[:12]}  {ref.name}")
+        elif args.command == "export":
+            count = 0
+            prefix = args.prefix.strip("/")
+            for ref in store.iter_refs(prefix):
+                relative = ref.name[len(prefix):].lstrip("/") or Path(ref.name).name
+                store.export(ref.name, args.directory / relative)
+                count += 1
+            print(f"Exported {count} artifacts to {args.directory}.")
+        else:
+            max_age = args.max_age_days * 86400 if args.max_age_days is not None else None
+            result = store.gc(max_age, args.max_size, args.dry_run)
+            verb = "Would remove" if args.dry_run else "Removed"
+            print(
+                f"{verb} {result.refs_removed} entries and {result.objects_removed} objects "
+                f"({result.bytes_freed / 1024 / 1024:.1f} MiB)."
+            )
+    except StoreError as exc:
+        print(f"Store error: {exc}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
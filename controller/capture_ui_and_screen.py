@@ -5,19 +5,80 @@ Capture a UI hierarchy dump and a matching screenshot from an Android device via
 - Runs `uiautomator dump` over `exec-out` to fetch the XML without temporary files.
 - Runs `adb shell screencap -p /sdcard/screen.png && adb pull ...` to save the
   screenshot alongside the UI dump.
+- Starts both captures concurrently and brackets each with the device clock
+  (`date +%s.%N`) so the skew between the XML and PNG is recorded in
+  `capture-timing.csv`.
 - Uses the same timestamp/stage prefix for both outputs so they can be correlated
   easily during analysis.
+- Optional burst mode captures N pairs at a fixed interval; pulling and writing
+  happen in a background worker so the next pair is not delayed by the last one.
+- With `--store`, the XML/PNG go into the content-addressed artifact store
+  (named `<output dir name>/<timestamp>-<stage>.xml|.png`) instead of loose files.
+- With `--raw`, the screenshot is streamed as raw pixels (`exec-out screencap`)
+  instead of being PNG-encoded on the phone; PNG/WebP encoding, `--scale` and
+  `--crop` then run on the host in a thread pool while the next pair is taken.
 """
 
 from __future__ import annotations
 
 import argparse
+import csv
+import queue
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
+
+from artifact_store import DEFAULT_STORE, ArtifactStore
+from raw_screencap import FORMAT_SUFFIXES, FrameEncoder, RawFrame, ScreencapError, parse_raw, parse_scale
 
 DEFAULT_OUTPUT_DIR = Path("/work/ui-dumps")
+DEVICE_CLOCK_CMD = "date +%s.%N"
+REMOTE_SCREENSHOT = "/sdcard/screen.png"
+TIMING_LOG_NAME = "capture-timing.csv"
+TIMING_FIELDS = [
+    "base",
+    "ui_start",
+    "ui_end",
+    "screenshot_start",
+    "screenshot_end",
+    "skew_s",
+]
+
+
+@dataclass
+class DeviceTiming:
+    start: Optional[float]
+    end: Optional[float]
+
+    @property
+    def midpoint(self) -> Optional[float]:
+        if self.start is None or self.end is None:
+            return None
+        return (self.start + self.end) / 2
+
+
+@dataclass
+class CapturePair:
+    base: str
+    ui_xml: str
+    ui_timing: DeviceTiming
+    remote_screenshot: Optional[str]
+    screenshot_timing: DeviceTiming
+    frame: Optional[RawFrame] = None
+
+    @property
+    def skew(self) -> Optional[float]:
+        ui_mid = self.ui_timing.midpoint
+        shot_mid = self.screenshot_timing.midpoint
+        if ui_mid is None or shot_mid is None:
+            return None
+        return ui_mid - shot_mid
 
 
 def parse_args() -> argparse.Namespace:
@@ -50,7 +111,55 @@ def parse_args() -> argparse.Namespace:
             "current time is used."
         ),
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "-n",
+        "--burst",
+        type=int,
+        default=1,
+        help="Number of UI/screenshot pairs to capture (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between pair starts in burst mode (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        nargs="?",
+        const=DEFAULT_STORE,
+        help=f"Write the XML/PNG into the artifact store (default root: {DEFAULT_STORE})",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="Pull raw pixels and encode on the host instead of running `screencap -p` on the device",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(FORMAT_SUFFIXES),
+        default="png",
+        help="Screenshot format in --raw mode (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--scale",
+        type=parse_scale,
+        default=1.0,
+        help="Downscale factor for --raw screenshots, e.g. 0.5 (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--crop",
+        type=int,
+        nargs=4,
+        metavar=("X1", "Y1", "X2", "Y2"),
+        help="Keep only this region of --raw screenshots (device pixels)",
+    )
+    args = parser.parse_args()
+    if not args.raw and (args.format != "png" or args.scale != 1.0 or args.crop):
+        parser.error("--format/--scale/--crop require --raw")
+    return args
 
 
 def adb_prefix(serial: str | None) -> List[str]:
@@ -62,42 +171,229 @@ def run_checked(cmd: List[str]) -> str:
     return result.stdout
 
 
-def capture_ui_dump(prefix: List[str]) -> str:
-    cmd = prefix + ["exec-out", "uiautomator", "dump", "/dev/tty"]
-    return run_checked(cmd)
+def run_checked_bytes(cmd: List[str]) -> bytes:
+    result = subprocess.run(cmd, check=True, capture_output=True)
+    return result.stdout
+
+
+def _parse_device_time(line: str) -> Optional[float]:
+    try:
+        return float(line.strip())
+    except ValueError:
+        return None
 
 
-def capture_screenshot(prefix: List[str], destination: Path) -> None:
-    remote_path = "/sdcard/screen.png"
-    shell_cmd = prefix + ["shell", "screencap", "-p", remote_path]
-    run_checked(shell_cmd)
+def split_device_times(output: str) -> Tuple[str, DeviceTiming]:
+    """Strip the leading/trailing `date` lines added around a device command."""
+    lines = output.strip().splitlines()
+    if len(lines) < 2:
+        return output, DeviceTiming(None, None)
+    timing = DeviceTiming(_parse_device_time(lines[0]), _parse_device_time(lines[-1]))
+    return "\n".join(lines[1:-1]), timing
+
+
+def capture_ui_dump(prefix: List[str]) -> Tuple[str, DeviceTiming]:
+    cmd = prefix + [
+        "exec-out",
+        f"{DEVICE_CLOCK_CMD}; uiautomator dump /dev/tty; {DEVICE_CLOCK_CMD}",
+    ]
+    return split_device_times(run_checked(cmd))
+
+
+def take_screenshot(prefix: List[str], remote_path: str = REMOTE_SCREENSHOT) -> DeviceTiming:
+    shell_cmd = prefix + [
+        "shell",
+        f"{DEVICE_CLOCK_CMD}; screencap -p {remote_path}; {DEVICE_CLOCK_CMD}",
+    ]
+    _, timing = split_device_times(run_checked(shell_cmd))
+    return timing
+
+
+def take_raw_screenshot(prefix: List[str]) -> Tuple[RawFrame, DeviceTiming]:
+    # The pixels contain arbitrary bytes, so both clock readings go after them:
+    # the three trailing newlines then delimit the frame unambiguously. Only the
+    # offsets are searched for, so the frame itself is never copied.
+    cmd = prefix + [
+        "exec-out",
+        f"s=$({DEVICE_CLOCK_CMD}); screencap; echo; echo $s; {DEVICE_CLOCK_CMD}",
+    ]
+    output = run_checked_bytes(cmd)
+    newlines: List[int] = []
+    for _ in range(3):
+        newlines.append(output.rfind(b"\n", 0, newlines[-1] if newlines else len(output)))
+        if newlines[-1] < 0:
+            raise ScreencapError("Unexpected raw screencap output (missing device clock readings).")
+    last, middle, first = newlines
+    start, end = output[first + 1 : middle].decode(), output[middle + 1 : last].decode()
+    timing = DeviceTiming(_parse_device_time(start), _parse_device_time(end))
+    return parse_raw(memoryview(output)[:first]), timing
+
+
+def pull_screenshot(prefix: List[str], remote_path: str, destination: Path) -> None:
     pull_cmd = prefix + ["pull", remote_path, str(destination)]
     run_checked(pull_cmd)
 
 
+def capture_pair(
+    executor: ThreadPoolExecutor,
+    prefix: List[str],
+    base: str,
+    remote_path: str,
+    raw: bool = False,
+) -> CapturePair:
+    ui_future = executor.submit(capture_ui_dump, prefix)
+    if raw:
+        frame, shot_timing = executor.submit(take_raw_screenshot, prefix).result()
+    else:
+        frame, shot_timing = None, executor.submit(take_screenshot, prefix, remote_path).result()
+    ui_xml, ui_timing = ui_future.result()
+    return CapturePair(
+        base=base,
+        ui_xml=ui_xml,
+        ui_timing=ui_timing,
+        remote_screenshot=None if raw else remote_path,
+        screenshot_timing=shot_timing,
+        frame=frame,
+    )
+
+
+def append_timing(output_dir: Path, pair: CapturePair) -> None:
+    log_path = output_dir / TIMING_LOG_NAME
+    new_file = not log_path.exists()
+    with log_path.open("a", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=TIMING_FIELDS)
+        if new_file:
+            writer.writeheader()
+        writer.writerow(
+            {
+                "base": pair.base,
+                "ui_start": pair.ui_timing.start,
+                "ui_end": pair.ui_timing.end,
+                "screenshot_start": pair.screenshot_timing.start,
+                "screenshot_end": pair.screenshot_timing.end,
+                "skew_s": f"{pair.skew:.3f}" if pair.skew is not None else "",
+            }
+        )
+
+
+def persist_pair(
+    prefix: List[str],
+    output_dir: Path,
+    pair: CapturePair,
+    cleanup: bool,
+    store: Optional[ArtifactStore] = None,
+    encoder: Optional[FrameEncoder] = None,
+) -> None:
+    ui_name = f"{pair.base}.xml"
+    screenshot_name = f"{pair.base}.png"
+    if pair.frame is not None and encoder is not None:
+        # Raw frames are encoded in the background; the pool is drained before exit.
+        screenshot_name = f"{pair.base}{encoder.suffix}"
+        if store is None:
+            ui_path = output_dir / ui_name
+            ui_path.write_text(pair.ui_xml, encoding="utf-8")
+            encoder.save(pair.frame, output_dir / screenshot_name)
+            ui_location, screenshot_location = str(ui_path), str(output_dir / screenshot_name)
+        else:
+            ui_ref = store.put_bytes(f"{output_dir.name}/{ui_name}", pair.ui_xml.encode("utf-8"))
+            name = f"{output_dir.name}/{screenshot_name}"
+            encoder.submit(lambda frame=pair.frame: store.put_bytes(name, encoder.encode_bytes(frame)))
+            ui_location = f"{ui_ref.name} [{ui_ref.digest[:12]}]"
+            screenshot_location = name
+    elif store is None:
+        ui_path = output_dir / ui_name
+        screenshot_path = output_dir / screenshot_name
+        ui_path.write_text(pair.ui_xml, encoding="utf-8")
+        pull_screenshot(prefix, pair.remote_screenshot, screenshot_path)
+        ui_location, screenshot_location = str(ui_path), str(screenshot_path)
+    else:
+        ui_ref = store.put_bytes(f"{output_dir.name}/{ui_name}", pair.ui_xml.encode("utf-8"))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            local_png = Path(tmpdir) / screenshot_name
+            pull_screenshot(prefix, pair.remote_screenshot, local_png)
+            screenshot_ref = store.put_file(f"{output_dir.name}/{screenshot_name}", local_png)
+        ui_location = f"{ui_ref.name} [{ui_ref.digest[:12]}]"
+        screenshot_location = f"{screenshot_ref.name} [{screenshot_ref.digest[:12]}]"
+    if cleanup and pair.remote_screenshot:
+        run_checked(prefix + ["shell", "rm", "-f", pair.remote_screenshot])
+    append_timing(output_dir, pair)
+
+    skew = f"{pair.skew * 1000:+.0f} ms" if pair.skew is not None else "unknown"
+    print(f"UI dump: {ui_location}")
+    print(f"Screenshot: {screenshot_location} (UI/screenshot skew: {skew})")
+
+
+def run_burst(
+    prefix: List[str],
+    output_dir: Path,
+    base: str,
+    count: int,
+    interval: float,
+    store: Optional[ArtifactStore] = None,
+    encoder: Optional[FrameEncoder] = None,
+) -> None:
+    pending: "queue.Queue[Optional[CapturePair]]" = queue.Queue()
+    errors: List[BaseException] = []
+
+    def writer() -> None:
+        while True:
+            pair = pending.get()
+            if pair is None:
+                return
+            try:
+                persist_pair(prefix, output_dir, pair, cleanup=True, store=store, encoder=encoder)
+            except Exception as exc:  # keep draining; one bad pair must not drop the rest
+                print(f"Failed to save {pair.base}: {exc}")
+                errors.append(exc)
+
+    worker = threading.Thread(target=writer, daemon=True)
+    worker.start()
+
+    started = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            for idx in range(count):
+                wait = started + idx * interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                frame_base = f"{base}-{idx:03d}"
+                print(f"Capturing pair {idx + 1}/{count} ({frame_base})...")
+                remote_path = f"/sdcard/screen-{frame_base}.png"
+                pending.put(capture_pair(executor, prefix, frame_base, remote_path, encoder is not None))
+    finally:
+        pending.put(None)
+        worker.join()
+
+    if errors:
+        raise errors[0]
+
+
 def main() -> int:
     args = parse_args()
     timestamp = args.timestamp or datetime.now().strftime("%Y%m%d-%H%M%S")
     base = f"{timestamp}-{args.stage}" if args.stage else timestamp
 
     args.output_dir.mkdir(parents=True, exist_ok=True)
-    ui_path = args.output_dir / f"{base}.xml"
-    screenshot_path = args.output_dir / f"{base}.png"
-
     prefix = adb_prefix(args.serial)
+    store = ArtifactStore(args.store) if args.store else None
+    encoder = FrameEncoder(args.format, args.scale, tuple(args.crop) if args.crop else None) if args.raw else None
 
-    print(f"Capturing UI dump to {ui_path}...")
-    ui_output = capture_ui_dump(prefix)
-    ui_path.write_text(ui_output, encoding="utf-8")
-
-    print(f"Capturing screenshot to {screenshot_path}...")
-    capture_screenshot(prefix, screenshot_path)
+    try:
+        if args.burst > 1:
+            run_burst(prefix, args.output_dir, base, args.burst, args.interval, store, encoder)
+        else:
+            suffix = encoder.suffix if encoder else ".png"
+            print(f"Capturing UI dump and screenshot to {args.output_dir / base}.xml/{suffix}...")
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                pair = capture_pair(executor, prefix, base, REMOTE_SCREENSHOT, args.raw)
+            persist_pair(prefix, args.output_dir, pair, cleanup=False, store=store, encoder=encoder)
+    finally:
+        if encoder is not None:
+            encoder.close()
 
     print("Done.")
-    print(f"UI dump: {ui_path}")
-    print(f"Screenshot: {screenshot_path}")
     return 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(main())
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Probe and cache per-device facts the other tools need at startup.
+
+Features
+- One ``adb shell`` round trip collects the build fingerprint, SDK level,
+  ``wm size`` / ``wm density`` and ``getevent -lp``, from which the touchscreen
+  input device and its ``ABS_MT_POSITION_X/Y`` ranges are picked.
+- Profiles are cached as ``/work/device-profiles/<serial>.json``. Loading one
+  costs a single ``getprop ro.build.fingerprint; getprop ro.serialno`` call; the
+  device is re-probed automatically when the build (or the device behind an
+  ``ip:port`` serial) changes.
+- ``DeviceProfile.to_display`` maps raw digitizer coordinates to display pixels
+  for devices whose touch panel resolution differs from the screen.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PROFILE_DIR = Path("/work/device-profiles")
+PROFILE_VERSION = 1
+SECTION_MARKER = "@@section "
+PROBE_SECTIONS = {
+    "fingerprint": "getprop ro.build.fingerprint",
+    "serialno": "getprop ro.serialno",
+    "sdk": "getprop ro.build.version.sdk",
+    "model": "getprop ro.product.model",
+    "size": "wm size",
+    "density": "wm density",
+    "getevent": "getevent -lp",
+}
+SIZE_PATTERN = re.compile(r"(Physical|Override) size:\s*(\d+)x(\d+)")
+DENSITY_PATTERN = re.compile(r"(Physical|Override) density:\s*(\d+)")
+DEVICE_PATTERN = re.compile(r"^add device \d+:\s*(\S+)")
+ABS_PATTERN = re.compile(r"(ABS_MT_POSITION_[XY])\s*:\s*value\s+-?\d+,\s*min\s+(-?\d+),\s*max\s+(-?\d+)")
+
+_loaded: Dict[Tuple[Optional[str], Path], "DeviceProfile"] = {}
+
+
+class ProfileError(RuntimeError):
+    pass
+
+
+@dataclass
+class DeviceProfile:
+    serial: Optional[str]
+    serialno: str
+    fingerprint: str
+    sdk: int
+    model: str
+    screen_width: int
+    screen_height: int
+    density: Optional[int]
+    touch_device: Optional[str]
+    touch_x: Optional[Tuple[int, int]]
+    touch_y: Optional[Tuple[int, int]]
+    probed_at: float
+    version: int = PROFILE_VERSION
+
+    @property
+    def needs_scaling(self) -> bool:
+        if self.touch_x is None or self.touch_y is None:
+            return False
+        return (self.touch_x[1] - self.touch_x[0] + 1, self.touch_y[1] - self.touch_y[0] + 1) != (
+            self.screen_width,
+            self.screen_height,
+        )
+
+    def to_display(self, x: int, y: int) -> Tuple[int, int]:
+        """Map digitizer coordinates to display pixels (natural orientation)."""
+        if not self.needs_scaling:
+            return x, y
+        (x_min, x_max), (y_min, y_max) = self.touch_x, self.touch_y  # type: ignore[misc]
+        return (
+            int((x - x_min) * self.screen_width / (x_max - x_min + 1)),
+            int((y - y_min) * self.screen_height / (y_max - y_min + 1)),
+        )
+
+
+# -------------------- Probing --------------------
+
+def adb_prefix(serial: Optional[str]) -> List[str]:
+    return ["adb", "-s", serial] if serial else ["adb"]
+
+
+def run_shell(serial: Optional[str], command: str) -> str:
+    result = subprocess.run(adb_prefix(serial) + ["shell", command], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ProfileError(result.stderr.strip() or f"adb shell failed: {command}")
+    return result.stdout
+
+
+def split_sections(output: str) -> Dict[str, str]:
+    sections: Dict[str, List[str]] = {}
+    current: Optional[str] = None
+    for line in output.splitlines():
+        line = line.rstrip("\r")
+        if line.startswith(SECTION_MARKER):
+            current = line[len(SECTION_MARKER):].strip()
+            sections[current] = []
+        elif current is not None:
+            sections[current].append(line)
+    return {name: "\n".join(lines).strip() for name, lines in sections.items()}
+
+
+def parse_wm(output: str, pattern: re.Pattern) -> Dict[str, Tuple[int, ...]]:
+    return {match.group(1): tuple(int(v) for v in match.groups()[1:]) for match in pattern.finditer(output)}
+
+
+def find_touchscreen(getevent_output: str) -> Tuple[Optional[str], Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """Return the first input device reporting both multi-touch position axes."""
+    device: Optional[str] = None
+    axes: Dict[str, Tuple[int, int]] = {}
+    for line in getevent_output.splitlines():
+        match = DEVICE_PATTERN.match(line.strip())
+        if match:
+            if device and len(axes) == 2:
+                break
+            device, axes = match.group(1), {}
+            continue
+        match = ABS_PATTERN.search(line)
+        if match and device:
+            axes[match.group(1)] = (int(match.group(2)), int(match.group(3)))
+    if device and len(axes) == 2:
+        return device, axes["ABS_MT_POSITION_X"], axes["ABS_MT_POSITION_Y"]
+    return None, None, None
+
+
+def probe(serial: Optional[str]) -> DeviceProfile:
+    script = "; ".join(f"echo '{SECTION_MARKER}{name}'; {cmd} 2>/dev/null" for name, cmd in PROBE_SECTIONS.items())
+    sections = split_sections(run_shell(serial, script))
+
+    sizes = parse_wm(sections.get("size", ""), SIZE_PATTERN)
+    size = sizes.get("Override") or sizes.get("Physical")
+    if not size:
+        raise ProfileError(f"Could not read the screen size from 'wm size': {sections.get('size', '')!r}")
+    densities = parse_wm(sections.get("density", ""), DENSITY_PATTERN)
+    density = densities.get("Override") or densities.get("Physical")
+    touch_device, touch_x, touch_y = find_touchscreen(sections.get("getevent", ""))
+
+    return DeviceProfile(
+        serial=serial,
+        serialno=sections.get("serialno", ""),
+        fingerprint=sections.get("fingerprint", ""),
+        sdk=int(sections.get("sdk") or 0),
+        model=sections.get("model", ""),
+        screen_width=size[0],
+        screen_height=size[1],
+        density=density[0] if density else None,
+        touch_device=touch_device,
+        touch_x=touch_x,
+        touch_y=touch_y,
+        probed_at=time.time(),
+    )
+
+
+# -------------------- Cache --------------------
+
+def profile_path(serial: Optional[str], profile_dir: Path = DEFAULT_PROFILE_DIR) -> Path:
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", serial) if serial else "default"
+    return profile_dir / f"{name}.json"
+
+
+def read_cached(path: Path) -> Optional[DeviceProfile]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if data.get("version") != PROFILE_VERSION:
+            return None
+        for key in ("touch_x", "touch_y"):
+            if data.get(key) is not None:
+                data[key] = tuple(data[key])
+        return DeviceProfile(**data)
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def write_cached(profile: DeviceProfile, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(json.dumps(asdict(profile), indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def is_current(profile: DeviceProfile, serial: Optional[str]) -> bool:
+    output = run_shell(serial, "getprop ro.build.fingerprint; getprop ro.serialno")
+    lines = [line.strip() for line in output.splitlines()] + ["", ""]
+    return (lines[0], lines[1]) == (profile.fingerprint, profile.serialno)
+
+
+def load_profile(
+    serial: Optional[str], profile_dir: Path = DEFAULT_PROFILE_DIR, refresh: bool = False
+) -> DeviceProfile:
+    """Return the cached profile for `serial`, re-probing when missing or stale."""
+    key = (serial, profile_dir)
+    if not refresh and key in _loaded:
+        return _loaded[key]
+
+    path = profile_path(serial, profile_dir)
+    profile = None if refresh else read_cached(path)
+    if profile is None or not is_current(profile, serial):
+        profile = probe(serial)
+        write_cached(profile, path)
+    _loaded[key] = profile
+    return profile
+
+
+# -------------------- CLI --------------------
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Show (and cache) a device capability profile")
+    parser.add_argument("-s", "--serial", help="ADB serial/ip:port")
+    parser.add_argument(
+        "--profile-dir",
+        type=Path,
+        default=DEFAULT_PROFILE_DIR,
+        help="Profile cache directory (default: %(default)s)",
+    )
+    parser.add_argument("--refresh", action="store_true", help="Re-probe even if the cache is current")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    try:
+        profile = load_profile(args.serial, args.profile_dir, args.refresh)
+    except FileNotFoundError:
+        print("adb not found. Ensure Android platform tools are available.", file=sys.stderr)
+        return 1
+    except ProfileError as exc:
+        print(f"Profile error: {exc}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(asdict(profile), indent=2))
+    if profile.touch_device is None:
+        print("No multi-touch input device found in 'getevent -lp'.", file=sys.stderr)
+    elif profile.needs_scaling:
+        print(
+            f"Touch panel range x={profile.touch_x} y={profile.touch_y} differs from the "
+            f"{profile.screen_width}x{profile.screen_height} display; use --display-coords when capturing.",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Capture raw framebuffer screenshots and encode them on the host.
+
+Features
+- ``adb exec-out screencap`` without ``-p`` skips the on-device PNG encode
+  (typically 300-700 ms per full-resolution frame) and streams the pixels as-is.
+- The header (width, height, pixel format and, on newer builds, a color space
+  word) is 12 or 16 bytes; its size is derived from the payload length, so no
+  SDK probing is needed.
+- Pixels are wrapped with ``Image.frombuffer`` over the received bytes without
+  copying; RGBA/RGBX frames are never converted until something is persisted.
+- ``FrameEncoder`` crops, downscales and encodes PNG/WebP in a thread pool, so
+  callers can grab the next frame while earlier ones are still being written.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import struct
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Union
+
+from PIL import Image
+
+HEADER_SIZES = (12, 16)
+ENCODE_WORKERS = 2
+PNG_COMPRESS_LEVEL = 1
+WEBP_QUALITY = 90
+FORMAT_SUFFIXES = {"png": ".png", "webp": ".webp"}
+
+# Android PixelFormat -> (Pillow mode, raw decoder mode, bytes per pixel)
+PIXEL_FORMATS = {
+    1: ("RGBA", "RGBA", 4),  # RGBA_8888
+    2: ("RGBX", "RGBX", 4),  # RGBX_8888
+    3: ("RGB", "RGB", 3),  # RGB_888
+    4: ("RGB", "BGR;16", 2),  # RGB_565
+    5: ("RGBA", "BGRA", 4),  # BGRA_8888
+}
+
+Region = Tuple[int, int, int, int]
+Buffer = Union[bytes, memoryview]
+
+
+class ScreencapError(RuntimeError):
+    pass
+
+
+@dataclass
+class RawFrame:
+    width: int
+    height: int
+    pixel_format: int
+    header_size: int
+    data: Buffer
+
+    @property
+    def pixels(self) -> memoryview:
+        return memoryview(self.data)[self.header_size :]
+
+    def image(self) -> Image.Image:
+        """Wrap the pixels in a Pillow image (shares memory for RGBA/RGBX frames)."""
+        mode, raw_mode, _ = PIXEL_FORMATS[self.pixel_format]
+        return Image.frombuffer(mode, (self.width, self.height), self.pixels, "raw", raw_mode, 0, 1)
+
+
+def parse_raw(data: Buffer) -> RawFrame:
+    """Parse a raw screencap; `data` may be a memoryview slice of a larger read (kept, not copied)."""
+    if len(data) < HEADER_SIZES[0]:
+        raise ScreencapError(f"Raw screencap too short ({len(data)} bytes).")
+    width, height, pixel_format = struct.unpack_from("<III", data)
+    if pixel_format not in PIXEL_FORMATS:
+        raise ScreencapError(f"Unsupported screencap pixel format {pixel_format}.")
+    header_size = len(data) - width * height * PIXEL_FORMATS[pixel_format][2]
+    if header_size not in HEADER_SIZES:
+        raise ScreencapError(
+            f"Raw screencap size {len(data)} does not match a {width}x{height} frame "
+            f"in format {pixel_format}."
+        )
+    return RawFrame(width, height, pixel_format, header_size, data)
+
+
+def parse_scale(value: str) -> float:
+    """argparse type for downscale factors in (0, 1]."""
+    try:
+        scale = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid scale: {value}") from None
+    if not 0 < scale <= 1:
+        raise argparse.ArgumentTypeError(f"Scale must be in (0, 1], got {value}")
+    return scale
+
+
+def grab_raw(prefix: List[str]) -> RawFrame:
+    result = subprocess.run(prefix + ["exec-out", "screencap"], capture_output=True)
+    if result.returncode != 0 or not result.stdout:
+        raise ScreencapError(result.stderr.decode(errors="replace").strip() or "screencap failed")
+    return parse_raw(result.stdout)
+
+
+# -------------------- Encoding --------------------
+
+class FrameEncoder:
+    """Crop/downscale/encode raw frames on a small thread pool."""
+
+    def __init__(
+        self,
+        fmt: str = "png",
+        scale: float = 1.0,
+        crop: Optional[Region] = None,
+        workers: int = ENCODE_WORKERS,
+    ) -> None:
+        if fmt not in FORMAT_SUFFIXES:
+            raise ScreencapError(f"Unknown image format: {fmt}")
+        if not 0 < scale <= 1:
+            raise ScreencapError(f"Scale must be in (0, 1], got {scale}")
+        self.fmt = fmt
+        self.suffix = FORMAT_SUFFIXES[fmt]
+        self.scale = scale
+        self.crop = crop
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending: List[Future] = []
+        self._lock = threading.Lock()
+
+    def render(self, frame: RawFrame) -> Image.Image:
+        image = frame.image()
+        if self.crop:
+            x1, y1, x2, y2 = self.crop
+            image = image.crop((max(0, x1), max(0, y1), min(frame.width, x2), min(frame.height, y2)))
+        if self.scale != 1.0:
+            factor = round(1 / self.scale)
+            if abs(factor * self.scale - 1) < 1e-6:
+                image = image.reduce(factor)
+            else:
+                size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+                image = image.resize(size, Image.BILINEAR)
+        return image.convert("RGB") if image.mode == "RGBX" else image
+
+    def encode_bytes(self, frame: RawFrame) -> bytes:
+        buffer = io.BytesIO()
+        image = self.render(frame)
+        if self.fmt == "webp":
+            image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=0)
+        else:
+            image.save(buffer, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+        return buffer.getvalue()
+
+    def _write(self, frame: RawFrame, destination: Path) -> Path:
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        destination.write_bytes(self.encode_bytes(frame))
+        return destination
+
+    def submit(self, fn: Callable[..., object], *args: object) -> Future:
+        future = self._executor.submit(fn, *args)
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done() or f.exception()]
+            self._pending.append(future)
+        return future
+
+    def save(self, frame: RawFrame, destination: Path) -> Future:
+        """Encode `frame` to `destination` in the background; returns the future."""
+        return self.submit(self._write, frame, destination)
+
+    def wait(self) -> None:
+        """Block until queued work is done, re-raising the first failure."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self) -> None:
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "FrameEncoder":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+# -------------------- CLI --------------------
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Grab a raw screencap and encode it on the host")
+    parser.add_argument("-s", "--serial", help="ADB serial/ip:port")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="Output image (.png or .webp)")
+    parser.add_argument("--scale", type=parse_scale, default=1.0, help="Downscale factor, e.g. 0.5 (default: 1.0)")
+    parser.add_argument(
+        "--crop",
+        type=int,
+        nargs=4,
+        metavar=("X1", "Y1", "X2", "Y2"),
+        help="Keep only this region (device pixels)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    fmt = "webp" if args.output.suffix.lower() == ".webp" else "png"
+    prefix = ["adb", "-s", args.serial] if args.serial else ["adb"]
+
+    try:
+        frame = grab_raw(prefix)
+        with FrameEncoder(fmt, args.scale, tuple(args.crop) if args.crop else None) as encoder:
+            encoder.save(frame, args.output)
+    except FileNotFoundError:
+        print("adb not found. Ensure Android platform tools are available.", file=sys.stderr)
+        return 1
+    except ScreencapError as exc:
+        print(f"Screencap error: {exc}", file=sys.stderr)
+        return 1
+
+    print(f"Saved {frame.width}x{frame.height} frame to {args.output}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
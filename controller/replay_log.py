@@ -9,30 +9,70 @@ Features
   swipe gestures and send ``adb shell input tap|swipe`` accordingly.
 - For element logs, map ``resource-id`` or ``text`` to the element center using
   the latest UI dump (JSON) and tap the resolved point.
+- Element entries may instead reference an image ``template`` (optionally with a
+  search ``region``); it is located in a fresh screencap right before the tap,
+  which also works on screens that expose no UI nodes.
+- Gesture logs from ``touch-event-capture.py --element-log`` replay each
+  tap/swipe relative to the element it hit, or at the recorded coordinates when
+  the element cannot be found.
 - Respect real-world timing between steps with an optional speed multiplier or
   fixed delay override.
 - Optionally capture a UI dump and/or screenshot after each step for validation.
+  ``--raw-screencap`` pulls raw pixels instead of ``screencap -p`` and encodes
+  the PNGs on the host in the background, so verification adds little latency.
+- ``replay-log.py compile LOG`` writes a replay plan (steps, adb payloads,
+  resolved coordinates and delays) keyed by a hash of the log, the UI dump and
+  the timing options. Running the plan (or passing ``--plan``) skips all
+  preprocessing while those inputs are unchanged and recompiles otherwise.
+- ``{"action": "key", "key": "HOME"}`` and ``{"action": "text", "value": "..."}``
+  entries become key/text steps in any log type. Consecutive key/text steps with
+  no timing gap are sent as one ``adb shell`` command (keycodes share a single
+  ``input keyevent``), saving a round trip per entry when filling forms.
+- ``--loop N|forever`` soaks the same steps in one process, retrying steps that
+  hit transient adb errors and periodically writing p50/p99/max adb latency and
+  step duration per step label to ``--stats-output``.
 """
 
 from __future__ import annotations
 
 import argparse
 import csv
+import hashlib
+import itertools
 import json
+import re
+import shlex
 import subprocess
 import sys
+import tempfile
 import time
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from artifact_store import DEFAULT_STORE, ArtifactStore
+from soak_stats import SoakStats
+
+if TYPE_CHECKING:
+    from raw_screencap import FrameEncoder
+    from template_locator import TemplateLocator
 
 DEFAULT_UI_SOURCE = Path("/work/ui-dumps")
 DEFAULT_VERIFY_DIR = Path("/work/replay-verification")
+DEFAULT_STATS_OUTPUT = Path("/work/replay-stats.json")
+PLAN_VERSION = 3
+SOAK_DEFAULT_RETRIES = 3
+DEVICE_WAIT_TIMEOUT = 30.0
+INPUT_ACTIONS = {"key", "text"}
+INPUT_COALESCE_GAP = 0.0
+KEYCODE_PATTERN = re.compile(r"^(KEYCODE_)?[A-Z0-9_]+$")
+
+T = TypeVar("T")
 
 
 @dataclass
 class ReplayStep:
-    kind: str  # "tap" | "swipe"
+    kind: str  # "tap" | "swipe" | "key" | "text" | "input" (coalesced key/text)
     start_x: int
     start_y: int
     end_x: int
@@ -40,6 +80,9 @@ class ReplayStep:
     start_ts: float
     end_ts: float
     label: str
+    template: Optional[Path] = None
+    search_region: Optional[Tuple[int, int, int, int]] = None
+    inputs: List[Tuple[str, str]] = field(default_factory=list)  # ("key"|"text", value)
 
 
 class ReplayError(RuntimeError):
@@ -119,13 +162,27 @@ def find_element_center(payload: Dict[str, object], resource_id: str | None, tex
 
 # -------------------- Touch collapsing --------------------
 
-def collapse_touch_events(events: List[Dict[str, object]]) -> List[ReplayStep]:
-    gestures: List[ReplayStep] = []
+def group_touch_events(events: List[Dict[str, object]]) -> List[List[Dict[str, object]]]:
+    """Split raw touch events into per-gesture runs (``down`` ... ``up``), oldest first."""
+    groups: List[List[Dict[str, object]]] = []
     buffer: List[Dict[str, object]] = []
+    for event in sorted(events, key=lambda e: float(e.get("timestamp", 0.0))):
+        action = str(event.get("action", "")).lower()
+        if action == "down" and buffer:
+            groups.append(buffer)
+            buffer = []
+        buffer.append(event)
+        if action == "up":
+            groups.append(buffer)
+            buffer = []
+    if buffer:
+        groups.append(buffer)
+    return groups
+
 
-    def flush_buffer() -> None:
-        if not buffer:
-            return
+def collapse_touch_events(events: List[Dict[str, object]]) -> List[ReplayStep]:
+    gestures: List[ReplayStep] = []
+    for buffer in group_touch_events(events):
         start = buffer[0]
         end = buffer[-1]
         start_ts = float(start.get("timestamp", 0.0))
@@ -148,29 +205,115 @@ def collapse_touch_events(events: List[Dict[str, object]]) -> List[ReplayStep]:
                 label=f"touch-{len(gestures)+1}",
             )
         )
-        buffer.clear()
-
-    for event in sorted(events, key=lambda e: float(e.get("timestamp", 0.0))):
-        action = str(event.get("action", "")).lower()
-        if action == "down" and buffer:
-            flush_buffer()
-        buffer.append(event)
-        if action == "up":
-            flush_buffer()
-
-    flush_buffer()
     return gestures
 
 
 # -------------------- Element steps --------------------
 
-def build_element_steps(entries: List[Dict[str, object]], ui_payload: Dict[str, object]) -> List[ReplayStep]:
+def is_element_entry(entry: Dict[str, object]) -> bool:
+    return bool(entry.get("resource_id") or entry.get("resource-id") or entry.get("text") or entry.get("template"))
+
+
+def is_gesture_entry(entry: Dict[str, object]) -> bool:
+    """Gesture entries from ``touch-event-capture.py --element-log`` (coordinates + element)."""
+    return str(entry.get("action", "")).lower() in {"tap", "swipe"} and "x" in entry and "y" in entry
+
+
+def uses_ui_dump(entries: List[Dict[str, object]]) -> bool:
+    return any(is_element_entry(e) and not e.get("template") for e in entries)
+
+
+def needs_ui_dump(entries: List[Dict[str, object]]) -> bool:
+    """Only pure element entries need a dump; gestures can fall back to their coordinates."""
+    return any(is_element_entry(e) and not e.get("template") and not is_gesture_entry(e) for e in entries)
+
+
+def _recorded_center(entry: Dict[str, object]) -> tuple[int, int]:
+    bounds = entry.get("bounds")
+    if isinstance(bounds, dict) and None not in (bounds.get("x1"), bounds.get("y1"), bounds.get("x2"), bounds.get("y2")):
+        return (int(bounds["x1"]) + int(bounds["x2"])) // 2, (int(bounds["y1"]) + int(bounds["y2"])) // 2
+    return int(entry["x"]), int(entry["y"])
+
+
+def _gesture_step(entry: Dict[str, object], resolved: Optional[tuple[int, int]], timestamp: float, label: str) -> ReplayStep:
+    """Replay a recorded gesture, shifted by how far its element moved since recording."""
+    dx = dy = 0
+    if resolved is not None:
+        center_x, center_y = _recorded_center(entry)
+        dx, dy = resolved[0] - center_x, resolved[1] - center_y
+    start_x, start_y = int(entry["x"]), int(entry["y"])
+    end_x, end_y = int(entry.get("end_x", start_x)), int(entry.get("end_y", start_y))
+    return ReplayStep(
+        kind=str(entry["action"]).lower(),
+        start_x=start_x + dx,
+        start_y=start_y + dy,
+        end_x=end_x + dx,
+        end_y=end_y + dy,
+        start_ts=timestamp,
+        end_ts=timestamp + float(entry.get("duration", 0.0)),
+        label=label,
+    )
+
+
+def _parse_region(raw: object) -> Optional[Tuple[int, int, int, int]]:
+    if not raw:
+        return None
+    if not isinstance(raw, (list, tuple)) or len(raw) != 4:
+        raise ReplayError(f"Template region must be [x1, y1, x2, y2], got {raw!r}")
+    x1, y1, x2, y2 = (int(v) for v in raw)
+    return x1, y1, x2, y2
+
+
+def build_element_steps(
+    entries: List[Dict[str, object]],
+    ui_payload: Optional[Dict[str, object]],
+    template_root: Path = Path("."),
+) -> List[ReplayStep]:
     steps: List[ReplayStep] = []
     for idx, entry in enumerate(sorted(entries, key=lambda e: float(e.get("timestamp", 0.0)))):
+        timestamp = float(entry.get("timestamp", idx))
+        template = entry.get("template")
+        if template:
+            # Coordinates are filled in by resolve_template_step at replay time.
+            steps.append(
+                ReplayStep(
+                    kind="tap",
+                    start_x=0,
+                    start_y=0,
+                    end_x=0,
+                    end_y=0,
+                    start_ts=timestamp,
+                    end_ts=timestamp,
+                    label=f"element-{len(steps)+1}",
+                    template=template_root / str(template),
+                    search_region=_parse_region(entry.get("region")),
+                )
+            )
+            continue
+
+        label = f"element-{len(steps)+1}"
         resource_id = entry.get("resource_id") or entry.get("resource-id")
         text = entry.get("text")
-        timestamp = float(entry.get("timestamp", idx))
-        x, y = find_element_center(ui_payload, str(resource_id) if resource_id else None, str(text) if text else None)
+        resolved: Optional[tuple[int, int]] = None
+        if (resource_id or text) and ui_payload is None:
+            if not is_gesture_entry(entry):
+                raise ReplayError("Element logs require a UI dump to resolve coordinates.")
+        elif resource_id or text:
+            try:
+                resolved = find_element_center(
+                    ui_payload, str(resource_id) if resource_id else None, str(text) if text else None
+                )
+            except ReplayError as exc:
+                if not is_gesture_entry(entry):
+                    raise
+                print(f"{label}: {exc}; using recorded coordinates.")
+
+        if is_gesture_entry(entry):
+            steps.append(_gesture_step(entry, resolved, timestamp, label))
+            continue
+
+        assert resolved is not None
+        x, y = resolved
         steps.append(
             ReplayStep(
                 kind="tap",
@@ -180,12 +323,114 @@ def build_element_steps(entries: List[Dict[str, object]], ui_payload: Dict[str,
                 end_y=y,
                 start_ts=timestamp,
                 end_ts=timestamp,
-                label=f"element-{len(steps)+1}",
+                label=label,
             )
         )
     return steps
 
 
+# -------------------- Key/text steps --------------------
+
+def is_input_entry(entry: Dict[str, object]) -> bool:
+    return str(entry.get("action", "")).lower() in INPUT_ACTIONS
+
+
+def normalize_keycode(raw: object) -> str:
+    if isinstance(raw, float) and raw.is_integer():
+        return str(int(raw))
+    key = str(raw).strip().upper()
+    if not key:
+        raise ReplayError("Key entry is missing a 'key' value.")
+    # Keys go into the device shell command unquoted, so only plain keycode names pass.
+    if not KEYCODE_PATTERN.match(key):
+        raise ReplayError(f"Invalid key {raw!r}; use a keycode name such as ENTER or KEYCODE_VOLUME_UP, or a number.")
+    return key if key.isdigit() or key.startswith("KEYCODE_") else f"KEYCODE_{key}"
+
+
+def build_input_steps(entries: List[Dict[str, object]]) -> List[ReplayStep]:
+    steps: List[ReplayStep] = []
+    counters = {"key": 0, "text": 0}
+    for idx, entry in enumerate(sorted(entries, key=lambda e: float(e.get("timestamp", 0.0)))):
+        kind = str(entry["action"]).lower()
+        value = normalize_keycode(entry.get("key", entry.get("keycode", ""))) if kind == "key" else str(entry.get("value", ""))
+        timestamp = float(entry.get("timestamp", idx))
+        counters[kind] += 1
+        steps.append(
+            ReplayStep(
+                kind=kind,
+                start_x=0,
+                start_y=0,
+                end_x=0,
+                end_y=0,
+                start_ts=timestamp,
+                end_ts=timestamp,
+                label=f"{kind}-{counters[kind]}",
+                inputs=[(kind, value)],
+            )
+        )
+    return steps
+
+
+def coalesce_input_steps(steps: List[ReplayStep], max_gap: float = INPUT_COALESCE_GAP) -> List[ReplayStep]:
+    """Merge runs of key/text steps with no timing gap into one device command."""
+    merged: List[ReplayStep] = []
+    for step in steps:
+        prev = merged[-1] if merged else None
+        if (
+            prev is not None
+            and prev.inputs
+            and step.inputs
+            and step.start_ts - prev.end_ts <= max_gap
+        ):
+            first_label = prev.label.split("..")[0]
+            merged[-1] = ReplayStep(
+                kind="input",
+                start_x=0,
+                start_y=0,
+                end_x=0,
+                end_y=0,
+                start_ts=prev.start_ts,
+                end_ts=step.end_ts,
+                label=f"{first_label}..{step.label}",
+                inputs=prev.inputs + step.inputs,
+            )
+            continue
+        merged.append(step)
+    return merged
+
+
+def build_input_command(inputs: Sequence[Tuple[str, str]]) -> List[str]:
+    """Chain key/text inputs into one ``adb shell`` call; adjacent keys share one keyevent."""
+    commands: List[str] = []
+    pending_keys: List[str] = []
+    for kind, value in inputs:
+        if kind == "key":
+            pending_keys.append(normalize_keycode(value))
+            continue
+        if pending_keys:
+            commands.append("input keyevent " + " ".join(pending_keys))
+            pending_keys = []
+        # `input text` reads %s as a space; quote the rest for the device shell.
+        commands.append("input text " + shlex.quote(value.replace(" ", "%s")))
+    if pending_keys:
+        commands.append("input keyevent " + " ".join(pending_keys))
+    return ["shell", " && ".join(commands)]
+
+
+# -------------------- Template steps --------------------
+
+def resolve_template_step(prefix: List[str], step: ReplayStep, locator: TemplateLocator) -> None:
+    from template_locator import TemplateError, grab_screen
+
+    try:
+        match = locator.locate(grab_screen(prefix), step.template, step.search_region)
+    except TemplateError as exc:
+        raise ReplayError(str(exc)) from exc
+    print(f"  {step.label}: template {step.template.name} at ({match.x}, {match.y}) score={match.score:.3f}")
+    step.start_x = step.end_x = match.x
+    step.start_y = step.end_y = match.y
+
+
 # -------------------- ADB helpers --------------------
 
 def adb_prefix(serial: Optional[str]) -> List[str]:
@@ -198,78 +443,341 @@ def run_adb(cmd: List[str]) -> None:
         raise ReplayError(result.stderr.strip() or "adb command failed")
 
 
-def send_gesture(prefix: List[str], step: ReplayStep, speed: float) -> None:
+def build_gesture_command(step: ReplayStep, speed: float) -> List[str]:
+    """Return the adb arguments (without the ``adb -s`` prefix) for a step."""
+    if step.inputs:
+        return build_input_command(step.inputs)
     if step.kind == "tap":
-        cmd = prefix + ["shell", "input", "tap", str(step.start_x), str(step.start_y)]
-    else:
-        duration_ms = max(1, int((step.end_ts - step.start_ts) * 1000 / max(speed, 0.0001)))
-        cmd = prefix + [
-            "shell",
-            "input",
-            "swipe",
-            str(step.start_x),
-            str(step.start_y),
-            str(step.end_x),
-            str(step.end_y),
-            str(duration_ms),
-        ]
+        return ["shell", "input", "tap", str(step.start_x), str(step.start_y)]
+    duration_ms = max(1, int((step.end_ts - step.start_ts) * 1000 / max(speed, 0.0001)))
+    return [
+        "shell",
+        "input",
+        "swipe",
+        str(step.start_x),
+        str(step.start_y),
+        str(step.end_x),
+        str(step.end_y),
+        str(duration_ms),
+    ]
+
+
+def send_gesture(prefix: List[str], step: ReplayStep, speed: float, command: Optional[List[str]] = None) -> float:
+    """Send a step and return the adb round-trip time in seconds."""
+    cmd = prefix + (command or build_gesture_command(step, speed))
     print(f"→ {step.label}: {' '.join(cmd)}")
+    started = time.perf_counter()
     run_adb(cmd)
+    return time.perf_counter() - started
 
 
-def capture_verification(prefix: List[str], mode: str, output_dir: Path, step_idx: int) -> None:
-    output_dir.mkdir(parents=True, exist_ok=True)
+def wait_for_device(prefix: List[str], timeout: float = DEVICE_WAIT_TIMEOUT) -> None:
+    try:
+        subprocess.run(prefix + ["wait-for-device"], capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        pass
+
+
+def capture_verification(
+    prefix: List[str],
+    mode: str,
+    output_dir: Path,
+    step_idx: int,
+    store: Optional[ArtifactStore] = None,
+    encoder: Optional[FrameEncoder] = None,
+) -> None:
     timestamp = time.strftime("%Y%m%d-%H%M%S")
     base_name = f"step{step_idx:03d}-{timestamp}"
 
-    if mode in {"ui", "both"}:
-        remote_xml = "/sdcard/replay_window_dump.xml"
-        run_adb(prefix + ["shell", "uiautomator", "dump", remote_xml])
-        run_adb(prefix + ["pull", remote_xml, str(output_dir / f"{base_name}.xml")])
-
-    if mode in {"screenshot", "both"}:
-        remote_png = "/sdcard/replay_screen.png"
-        run_adb(prefix + ["shell", "screencap", "-p", remote_png])
-        run_adb(prefix + ["pull", remote_png, str(output_dir / f"{base_name}.png")])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # With a store, pull into a scratch dir and keep only the deduplicated blobs.
+        target_dir = Path(tmpdir) if store else output_dir
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+        if mode in {"ui", "both"}:
+            remote_xml = "/sdcard/replay_window_dump.xml"
+            run_adb(prefix + ["shell", "uiautomator", "dump", remote_xml])
+            run_adb(prefix + ["pull", remote_xml, str(target_dir / f"{base_name}.xml")])
+
+        if mode in {"screenshot", "both"} and encoder is not None:
+            from raw_screencap import ScreencapError, grab_raw
+
+            try:
+                frame = grab_raw(prefix)
+            except ScreencapError as exc:
+                raise ReplayError(str(exc)) from exc
+            name = f"{base_name}{encoder.suffix}"
+            if store is None:
+                encoder.save(frame, output_dir / name)
+            else:
+                encoder.submit(lambda: store.put_bytes(f"{output_dir.name}/{name}", encoder.encode_bytes(frame)))
+        elif mode in {"screenshot", "both"}:
+            remote_png = "/sdcard/replay_screen.png"
+            run_adb(prefix + ["shell", "screencap", "-p", remote_png])
+            run_adb(prefix + ["pull", remote_png, str(target_dir / f"{base_name}.png")])
+
+        if store is not None:
+            for path in sorted(target_dir.iterdir()):
+                store.put_file(f"{output_dir.name}/{path.name}", path)
 
 
 # -------------------- Timing helpers --------------------
 
-def compute_delay(prev_end: Optional[float], next_start: float, speed: float, fixed: Optional[float]) -> float:
+def step_gaps(steps: List[ReplayStep]) -> List[float]:
+    """Recorded idle time before each step (0 for the first), unscaled."""
+    gaps: List[float] = []
+    prev_end: Optional[float] = None
+    for step in steps:
+        gaps.append(0.0 if prev_end is None else max(0.0, step.start_ts - prev_end))
+        prev_end = step.end_ts
+    return gaps
+
+
+def compute_delay(gap: float, speed: float, fixed: Optional[float]) -> float:
     if fixed is not None:
         return max(0.0, fixed)
-    if prev_end is None:
-        return 0.0
-    raw_delay = max(0.0, next_start - prev_end)
-    return raw_delay / max(speed, 0.0001)
+    return gap / max(speed, 0.0001)
+
+
+# -------------------- Step building --------------------
+
+def build_steps(log_path: Path, ui_source: Optional[Path]) -> tuple[List[ReplayStep], Optional[Path]]:
+    """Parse a log into replay steps; also return the UI dump used, if any."""
+    all_entries = load_log_entries(log_path)
+    log_entries = [e for e in all_entries if not is_input_entry(e)]
+    input_steps = build_input_steps([e for e in all_entries if is_input_entry(e)])
+
+    has_touch = any(
+        "x" in e and "y" in e and not is_element_entry(e) and not is_gesture_entry(e) for e in log_entries
+    )
+    has_element = any(is_element_entry(e) or is_gesture_entry(e) for e in log_entries)
+
+    if has_touch and has_element:
+        raise ReplayError("Mixed touch and element entries are not supported in a single log.")
+
+    ui_path: Optional[Path] = None
+    ui_payload: Optional[Dict[str, object]] = None
+    if has_element and uses_ui_dump(log_entries):
+        ui_path = resolve_ui_source(ui_source)
+        if ui_path:
+            ui_payload = load_ui_dump(ui_path)
+        elif needs_ui_dump(log_entries):
+            raise ReplayError("UI dump not found. Provide --ui-source pointing to a JSON file or directory.")
+        else:
+            print("No UI dump found; replaying gestures at their recorded coordinates.")
+
+    if has_touch:
+        steps = collapse_touch_events(log_entries)
+    else:
+        steps = build_element_steps(log_entries, ui_payload, log_path.resolve().parent)
+    if input_steps:
+        steps = coalesce_input_steps(sorted(steps + input_steps, key=lambda s: s.start_ts))
+    return steps, ui_path
+
+
+# -------------------- Replay plans --------------------
+
+@dataclass
+class ReplayPlan:
+    """Resolved steps and adb commands; timing stays unscaled so any --speed reuses the plan."""
+
+    key: str
+    source_log: str
+    ui_dump: Optional[str]
+    speed: float  # defaults for running the plan file directly, not part of the key
+    fixed_delay: Optional[float]
+    steps: List[ReplayStep]
+    commands: List[List[str]]  # at speed 1.0; empty for template steps (resolved at replay time)
+    gaps: List[float]
+
+    def commands_for(self, speed: float) -> List[List[str]]:
+        """Commands with swipe durations scaled for `speed` (taps and input do not depend on it)."""
+        if speed == 1.0:
+            return self.commands
+        return [
+            build_gesture_command(step, speed) if command and step.kind == "swipe" and not step.inputs else command
+            for step, command in zip(self.steps, self.commands)
+        ]
+
+    def delays_for(self, speed: float, fixed_delay: Optional[float]) -> List[float]:
+        return [compute_delay(gap, speed, fixed_delay) for gap in self.gaps]
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def plan_key(log_path: Path, ui_path: Optional[Path]) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"v{PLAN_VERSION}|".encode("utf-8"))
+    digest.update(_file_digest(log_path).encode("ascii"))
+    if ui_path is not None:
+        digest.update(_file_digest(ui_path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def compile_plan(log_path: Path, ui_source: Optional[Path], speed: float, fixed_delay: Optional[float]) -> ReplayPlan:
+    steps, ui_path = build_steps(log_path, ui_source)
+    return ReplayPlan(
+        key=plan_key(log_path, ui_path),
+        source_log=str(log_path.resolve()),
+        ui_dump=str(ui_path.resolve()) if ui_path else None,
+        speed=speed,
+        fixed_delay=fixed_delay,
+        steps=steps,
+        commands=[[] if s.template is not None else build_gesture_command(s, 1.0) for s in steps],
+        gaps=step_gaps(steps),
+    )
+
+
+def is_plan_file(path: Path) -> bool:
+    if path.suffix.lower() != ".json" or not path.is_file():
+        return False
+    with path.open("rb") as handle:
+        return b'"plan_version"' in handle.read(64)
+
+
+def save_plan(plan: ReplayPlan, path: Path) -> None:
+    payload = {"plan_version": PLAN_VERSION, **asdict(plan)}
+    for step in payload["steps"]:
+        if step["template"] is not None:
+            step["template"] = str(step["template"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+
+
+def load_plan(path: Path) -> ReplayPlan:
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    if payload.pop("plan_version", None) != PLAN_VERSION:
+        raise ReplayError(f"Unsupported replay plan version in {path}; recompile it.")
+    steps = []
+    for raw in payload.pop("steps"):
+        if raw.get("template") is not None:
+            raw["template"] = Path(raw["template"])
+        if raw.get("search_region") is not None:
+            raw["search_region"] = tuple(raw["search_region"])
+        raw["inputs"] = [tuple(item) for item in raw.get("inputs", [])]
+        steps.append(ReplayStep(**raw))
+    return ReplayPlan(steps=steps, **payload)
+
+
+def plan_is_fresh(plan: ReplayPlan, log_path: Path, ui_source: Optional[Path]) -> bool:
+    if not log_path.is_file() or Path(plan.source_log).resolve() != log_path.resolve():
+        return False
+    ui_path = resolve_ui_source(ui_source) if plan.ui_dump else None
+    if plan.ui_dump and ui_path is None:
+        return False
+    return plan.key == plan_key(log_path, ui_path)
+
+
+def ensure_plan(
+    plan_path: Optional[Path],
+    log_path: Path,
+    ui_source: Optional[Path],
+    speed: float,
+    fixed_delay: Optional[float],
+) -> ReplayPlan:
+    """Load a cached plan when its log and UI dump are unchanged, otherwise (re)compile it.
+
+    `speed` / `fixed_delay` are only recorded as defaults of a newly compiled plan.
+    """
+    if plan_path is not None and plan_path.is_file():
+        try:
+            plan = load_plan(plan_path)
+        except ReplayError:
+            if not log_path.is_file():
+                raise
+            print(f"Plan {plan_path} has an older format; recompiling.")
+        else:
+            if plan_is_fresh(plan, log_path, ui_source):
+                print(f"Using compiled plan {plan_path}.")
+                return plan
+            if not log_path.is_file():
+                print(f"Source log {log_path} is missing; using plan {plan_path} as-is.")
+                return plan
+            print(f"Plan {plan_path} is stale; recompiling.")
+
+    plan = compile_plan(log_path, ui_source, speed, fixed_delay)
+    if plan_path is not None:
+        save_plan(plan, plan_path)
+    return plan
+
+
+def default_plan_path(log_path: Path) -> Path:
+    return log_path.with_name(f"{log_path.stem}.plan.json")
+
+
+# -------------------- Soak helpers --------------------
+
+def parse_loop(value: str) -> Optional[int]:
+    if value.lower() in {"forever", "inf"}:
+        return None
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"--loop expects a count or 'forever', got {value!r}")
+    if count < 1:
+        raise argparse.ArgumentTypeError("--loop count must be at least 1")
+    return count
 
 
 # -------------------- CLI --------------------
 
-def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Replay touch or element logs via ADB")
-    parser.add_argument("log", type=Path, help="Path to touch or element log (JSON/CSV)")
+def add_timing_args(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "--ui-source",
         type=Path,
-        default=DEFAULT_UI_SOURCE,
         help=(
             "UI dump source (file or directory). Required for element logs. "
-            "Default: /work/ui-dumps (picks latest JSON in the directory)."
+            "Default: /work/ui-dumps (picks latest JSON in the directory), or the "
+            "dump a plan was compiled with when running a plan file."
         ),
     )
-    parser.add_argument("-s", "--serial", help="ADB serial/ip:port")
     parser.add_argument(
         "--speed",
         type=float,
-        default=1.0,
-        help="Speed multiplier (2.0 = 2x faster timing between steps)",
+        help="Speed multiplier (2.0 = 2x faster timing between steps; default 1.0)",
     )
     parser.add_argument(
         "--fixed-delay",
         type=float,
         help="Override delay between steps with a fixed number of seconds",
     )
+
+
+def parse_compile_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="replay-log.py compile",
+        description="Precompute a replay plan for a touch or element log",
+    )
+    parser.add_argument("log", type=Path, help="Path to touch or element log (JSON/CSV)")
+    add_timing_args(parser)
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="Plan output path (default: <log stem>.plan.json next to the log)",
+    )
+    return parser.parse_args(argv)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Replay touch or element logs via ADB",
+        epilog="Use 'replay-log.py compile LOG' to precompute a replay plan.",
+    )
+    parser.add_argument(
+        "log",
+        type=Path,
+        help="Path to touch or element log (JSON/CSV) or a compiled replay plan",
+    )
+    add_timing_args(parser)
+    parser.add_argument("-s", "--serial", help="ADB serial/ip:port")
+    parser.add_argument(
+        "--plan",
+        type=Path,
+        help="Replay plan cache: used when up to date, otherwise recompiled and rewritten",
+    )
     parser.add_argument(
         "--verify",
         choices=["none", "ui", "screenshot", "both"],
@@ -282,56 +790,187 @@ def parse_args() -> argparse.Namespace:
         default=DEFAULT_VERIFY_DIR,
         help="Where to store validation outputs (when --verify is enabled)",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--store",
+        type=Path,
+        nargs="?",
+        const=DEFAULT_STORE,
+        help=(
+            "Write validation outputs into the content-addressed artifact store "
+            f"(default root: {DEFAULT_STORE}) under the --verify-dir name"
+        ),
+    )
+    parser.add_argument(
+        "--template-threshold",
+        type=float,
+        default=0.8,
+        help="Minimum match score for template-based element entries (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--raw-screencap",
+        action="store_true",
+        help="Capture verification screenshots as raw pixels and encode them on the host",
+    )
+    parser.add_argument(
+        "--loop",
+        type=parse_loop,
+        default=1,
+        metavar="N|forever",
+        help="Replay the steps N times (or forever) in one process (default: 1)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        help=(
+            "Retry a step this many times after an adb error, waiting for the device "
+            f"between attempts (default: 0, or {SOAK_DEFAULT_RETRIES} with --loop)"
+        ),
+    )
+    parser.add_argument(
+        "--stats-output",
+        type=Path,
+        default=DEFAULT_STATS_OUTPUT,
+        help="Where to write latency snapshots during --loop (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=60.0,
+        help="Seconds between latency snapshots during --loop (default: %(default)s)",
+    )
+    return parser.parse_args(argv)
 
 
 # -------------------- Main --------------------
 
-def main() -> int:
-    args = parse_args()
-    log_entries = load_log_entries(args.log)
-
-    has_touch = any("x" in e and "y" in e for e in log_entries)
-    has_element = any(e.get("resource_id") or e.get("resource-id") or e.get("text") for e in log_entries)
-
-    if has_touch and has_element:
-        raise ReplayError("Mixed touch and element entries are not supported in a single log.")
+def compile_main(argv: List[str]) -> int:
+    args = parse_compile_args(argv)
+    speed = args.speed if args.speed is not None else 1.0
+    plan = compile_plan(args.log, args.ui_source or DEFAULT_UI_SOURCE, speed, args.fixed_delay)
+    output = args.output or default_plan_path(args.log)
+    save_plan(plan, output)
+    print(f"Compiled {len(plan.steps)} steps to {output} (key {plan.key[:12]}).")
+    return 0
 
-    ui_payload: Optional[Dict[str, object]] = None
-    if has_element:
-        ui_path = resolve_ui_source(args.ui_source)
-        if not ui_path:
-            raise ReplayError("UI dump not found. Provide --ui-source pointing to a JSON file or directory.")
-        ui_payload = load_ui_dump(ui_path)
 
-    if has_touch:
-        steps = collapse_touch_events(log_entries)
-    else:
-        if ui_payload is None:
-            raise ReplayError("Element logs require a UI dump to resolve coordinates.")
-        steps = build_element_steps(log_entries, ui_payload)
+def main() -> int:
+    argv = sys.argv[1:]
+    if argv[:1] == ["compile"]:
+        return compile_main(argv[1:])
+
+    args = parse_args(argv)
+    log_path: Path = args.log
+    plan_path: Optional[Path] = args.plan
+    speed = args.speed
+    fixed_delay = args.fixed_delay
+    ui_source: Optional[Path] = args.ui_source
+
+    if is_plan_file(args.log):
+        # Running a plan directly: keep its timing and UI dump unless overridden on the CLI.
+        cached = load_plan(args.log)
+        plan_path = args.log
+        log_path = Path(cached.source_log)
+        speed = cached.speed if speed is None else speed
+        fixed_delay = cached.fixed_delay if fixed_delay is None else fixed_delay
+        if ui_source is None and cached.ui_dump:
+            ui_source = Path(cached.ui_dump)
+
+    speed = 1.0 if speed is None else speed
+    plan = ensure_plan(plan_path, log_path, ui_source or DEFAULT_UI_SOURCE, speed, fixed_delay)
+    steps = plan.steps
 
     if not steps:
         print("No replayable steps found in the log.")
         return 0
 
     prefix = adb_prefix(args.serial)
-    prev_end = None
-
-    print(f"Loaded {len(steps)} steps. Starting replay (speed={args.speed}, fixed_delay={args.fixed_delay}).")
-
-    for idx, step in enumerate(steps, start=1):
-        delay = compute_delay(prev_end, step.start_ts, args.speed, args.fixed_delay)
-        if delay > 0:
-            print(f"Waiting {delay:.3f}s before step {idx} ({step.label})...")
-            time.sleep(delay)
-
-        send_gesture(prefix, step, args.speed)
+    locator: Optional[TemplateLocator] = None
+    store = ArtifactStore(args.store) if args.store else None
+    soak = args.loop != 1
+    retries = args.retries if args.retries is not None else (SOAK_DEFAULT_RETRIES if soak else 0)
+    stats = SoakStats(args.stats_output if soak else None, args.stats_interval)
+    encoder: Optional[FrameEncoder] = None
+    if args.raw_screencap and args.verify in {"screenshot", "both"}:
+        from raw_screencap import FrameEncoder
+
+        encoder = FrameEncoder()
+
+    def send_step(idx: int, step: ReplayStep) -> float:
+        nonlocal locator
+        if step.template is not None:
+            if locator is None:
+                from template_locator import TemplateLocator
+
+                locator = TemplateLocator(threshold=args.template_threshold)
+            resolve_template_step(prefix, step, locator)
+        return send_gesture(prefix, step, speed, commands[idx - 1])
+
+    def with_retries(label: str, action: Callable[[], T], what: str = "") -> Tuple[bool, Optional[T]]:
+        """Run `action` under the retry policy; (False, None) once a soak gives up on it."""
+        name = f"{label}{what}"
+        for attempt in range(retries + 1):
+            try:
+                return True, action()
+            except ReplayError as exc:
+                if attempt == retries:
+                    stats.record_error(label)
+                    if not soak:
+                        raise
+                    print(f"  {name} failed after {retries + 1} attempts: {exc}; continuing.")
+                    return False, None
+                stats.record_retry(label)
+                print(f"  {name} failed ({exc}); retry {attempt + 1}/{retries}...")
+                wait_for_device(prefix)
+                time.sleep(min(5.0, attempt + 1.0))
+        return False, None
+
+    commands = plan.commands_for(speed)
+    delays = plan.delays_for(speed, fixed_delay)
+    print(f"Loaded {len(steps)} steps. Starting replay (speed={speed}, fixed_delay={fixed_delay}).")
+    iterations = itertools.count(1) if args.loop is None else range(1, args.loop + 1)
 
-        if args.verify != "none":
-            capture_verification(prefix, args.verify, args.verify_dir, idx)
-
-        prev_end = step.end_ts
+    try:
+        for iteration in iterations:
+            if soak:
+                print(f"=== Iteration {iteration}{'' if args.loop is None else f'/{args.loop}'} ===")
+            for idx, step in enumerate(steps, start=1):
+                delay = delays[idx - 1]
+                if delay > 0:
+                    print(f"Waiting {delay:.3f}s before step {idx} ({step.label})...")
+                    time.sleep(delay)
+
+                started = time.perf_counter()
+                # Only a failed send is resent; a failed verification is retried on its own so
+                # taps and typed text never reach the device twice.
+                sent, adb_seconds = with_retries(step.label, lambda: send_step(idx, step))
+                if sent and args.verify != "none":
+                    with_retries(
+                        step.label,
+                        lambda: capture_verification(prefix, args.verify, args.verify_dir, idx, store, encoder),
+                        " verification",
+                    )
+                stats.record(step.label, adb_seconds, time.perf_counter() - started)
+                if soak:
+                    stats.maybe_write()
+            stats.iterations = iteration
+    except KeyboardInterrupt:
+        if not soak:
+            raise
+        print("\nSoak interrupted.")
+    finally:
+        if encoder is not None:
+            encoder.close()
+
+    if soak:
+        stats.write()
+        print(f"Soak finished after {stats.iterations} iterations; stats written to {args.stats_output}.")
+        for label, entry in stats.snapshot()["steps"].items():  # type: ignore[union-attr]
+            step_stats = entry["step"] or {}
+            print(
+                f"  {label}: p50={step_stats.get('p50_ms')}ms p99={step_stats.get('p99_ms')}ms "
+                f"max={step_stats.get('max_ms')}ms errors={entry['errors']}"
+            )
+        return 0
 
     print("Replay finished.")
     return 0
@@ -342,4 +981,4 @@ if __name__ == "__main__":
         raise SystemExit(main())
     except ReplayError as exc:
         print(f"Replay failed: {exc}", file=sys.stderr)
-        raise SystemExit(1)
\ No newline at end of file
+        raise SystemExit(1)
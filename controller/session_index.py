@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Index recorded touch logs, element logs and UI dumps into SQLite for fast search.
+
+Features
+- ``index`` walks ``/work`` (or given roots) and ingests new or changed files
+  only, keyed by path, size and mtime; rows of deleted files are dropped.
+- Touch logs are stored as gestures collapsed by ``collapse_touch_events``
+  (per serial for merged multi-device logs) with duration, timing and a
+  bounding box over every sampled point of the gesture. Element and gesture
+  logs keep the resource-id/text each step targets.
+- UI dumps (``ui-dump-capture.py`` JSON or raw ``uiautomator`` XML) are stored
+  node by node with their bounds.
+- ``gestures`` / ``nodes`` / ``stats`` answer queries such as "every session that
+  swiped in region X" or "every log that tapped resource-id Y" in milliseconds.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from replay_log import (
+    collapse_touch_events,
+    group_touch_events,
+    is_element_entry,
+    is_gesture_entry,
+    is_input_entry,
+    load_log_entries,
+)
+from ui_dump_capture import parse_nodes
+
+DEFAULT_DB = Path("/work/session-index.sqlite")
+DEFAULT_ROOT = Path("/work")
+INDEXED_SUFFIXES = {".json", ".csv", ".xml"}
+SKIPPED_DIRS = {"artifacts", "__pycache__"}
+INDEX_VERSION = 1  # bump when extraction changes so existing rows are rebuilt
+STAGE_PATTERN = re.compile(r"^\d{8}-\d{6}-(.+?)(?:-\d{3})?$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    stage TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS gestures (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    serial TEXT,
+    kind TEXT NOT NULL,
+    start_ts REAL,
+    duration REAL,
+    start_x INTEGER, start_y INTEGER, end_x INTEGER, end_y INTEGER,
+    min_x INTEGER, min_y INTEGER, max_x INTEGER, max_y INTEGER,
+    resource_id TEXT,
+    text TEXT,
+    class TEXT,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    resource_id TEXT,
+    text TEXT,
+    class TEXT,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER
+);
+CREATE INDEX IF NOT EXISTS gestures_file ON gestures(file_id);
+CREATE INDEX IF NOT EXISTS gestures_kind_box ON gestures(kind, min_x, max_x, min_y, max_y);
+CREATE INDEX IF NOT EXISTS gestures_resource_id ON gestures(resource_id);
+CREATE INDEX IF NOT EXISTS gestures_text ON gestures(text);
+CREATE INDEX IF NOT EXISTS gestures_serial ON gestures(serial);
+CREATE INDEX IF NOT EXISTS nodes_file ON nodes(file_id);
+CREATE INDEX IF NOT EXISTS nodes_resource_id ON nodes(resource_id);
+CREATE INDEX IF NOT EXISTS nodes_text ON nodes(text);
+CREATE INDEX IF NOT EXISTS files_stage ON files(stage);
+"""
+
+GestureRow = Tuple[object, ...]
+NodeRow = Tuple[object, ...]
+
+
+def connect(db_path: Path) -> sqlite3.Connection:
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(SCHEMA)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+        conn.execute("DELETE FROM files")
+        conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        conn.commit()
+    return conn
+
+
+# -------------------- Extraction --------------------
+
+def stage_from_name(path: Path) -> Optional[str]:
+    match = STAGE_PATTERN.match(path.stem)
+    return match.group(1) if match else None
+
+
+def _int_or_none(value: object) -> Optional[int]:
+    return None if value in (None, "") else int(float(value))  # type: ignore[arg-type]
+
+
+def touch_gesture_rows(entries: List[Dict[str, object]]) -> List[GestureRow]:
+    by_serial: Dict[Optional[str], List[Dict[str, object]]] = {}
+    for entry in entries:
+        serial = entry.get("serial")
+        by_serial.setdefault(str(serial) if serial else None, []).append(entry)
+
+    rows: List[GestureRow] = []
+    for serial, events in by_serial.items():
+        for group, step in zip(group_touch_events(events), collapse_touch_events(events)):
+            xs = [int(e["x"]) for e in group if "x" in e] or [step.start_x]  # type: ignore[arg-type]
+            ys = [int(e["y"]) for e in group if "y" in e] or [step.start_y]  # type: ignore[arg-type]
+            rows.append(
+                (
+                    len(rows) + 1, serial, step.kind, step.start_ts, round(step.end_ts - step.start_ts, 6),
+                    step.start_x, step.start_y, step.end_x, step.end_y,
+                    min(xs), min(ys), max(xs), max(ys),
+                    None, None, None, None,
+                )
+            )
+    return rows
+
+
+def log_entry_rows(entries: List[Dict[str, object]]) -> List[GestureRow]:
+    """Rows for element logs, combined gesture logs and key/text entries."""
+    rows: List[GestureRow] = []
+    for entry in sorted(entries, key=lambda e: float(e.get("timestamp", 0.0))):  # type: ignore[arg-type]
+        if is_input_entry(entry):
+            kind = str(entry["action"]).lower()
+            value = entry.get("key", entry.get("keycode")) if kind == "key" else entry.get("value")
+            rows.append((len(rows) + 1, entry.get("serial"), kind, entry.get("timestamp"), 0.0)
+                        + (None,) * 11 + (str(value),))
+            continue
+        if not (is_element_entry(entry) or is_gesture_entry(entry)):
+            continue
+        x, y = _int_or_none(entry.get("x")), _int_or_none(entry.get("y"))
+        end_x = _int_or_none(entry.get("end_x", x))
+        end_y = _int_or_none(entry.get("end_y", y))
+        xs = [v for v in (x, end_x) if v is not None]
+        ys = [v for v in (y, end_y) if v is not None]
+        rows.append(
+            (
+                len(rows) + 1,
+                entry.get("serial"),
+                str(entry.get("action", "tap")).lower() if is_gesture_entry(entry) else "tap",
+                entry.get("timestamp"),
+                float(entry.get("duration", 0.0)),  # type: ignore[arg-type]
+                x, y, end_x, end_y,
+                min(xs) if xs else None, min(ys) if ys else None,
+                max(xs) if xs else None, max(ys) if ys else None,
+                entry.get("resource_id") or entry.get("resource-id"),
+                entry.get("text"),
+                entry.get("class"),
+                entry.get("template"),
+            )
+        )
+    return rows
+
+
+def node_rows(nodes: Sequence[Dict[str, object]]) -> List[NodeRow]:
+    rows: List[NodeRow] = []
+    for node in nodes:
+        bounds = node.get("bounds") or {}
+        rows.append(
+            (
+                node.get("resource_id") or None,
+                node.get("text") or None,
+                node.get("class") or None,
+                bounds.get("x1"), bounds.get("y1"), bounds.get("x2"), bounds.get("y2"),  # type: ignore[union-attr]
+            )
+        )
+    return rows
+
+
+def extract(path: Path) -> Optional[Tuple[str, Optional[str], List[GestureRow], List[NodeRow]]]:
+    """Classify a file and return (kind, stage, gesture rows, node rows), or None to skip."""
+    stage = stage_from_name(path)
+    suffix = path.suffix.lower()
+
+    if suffix == ".xml":
+        raw = path.read_text(encoding="utf-8", errors="replace")
+        end = raw.rfind("</hierarchy>")
+        if end < 0:
+            return None
+        root = ET.fromstring(raw[: end + len("</hierarchy>")])
+        return "ui_dump", stage, [], node_rows(parse_nodes(root))
+
+    if suffix == ".json":
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(payload, dict):
+            if "nodes" in payload and "lookup" in payload:
+                return "ui_dump", payload.get("stage") or stage, [], node_rows(payload["nodes"])
+            return None
+        entries = payload
+    else:
+        entries = load_log_entries(path)
+
+    if not isinstance(entries, list) or not entries or not all(isinstance(e, dict) for e in entries):
+        return None
+    if any(is_element_entry(e) or is_gesture_entry(e) or is_input_entry(e) for e in entries):
+        kind = "gesture_log" if any(is_gesture_entry(e) for e in entries) else "element_log"
+        return kind, stage, log_entry_rows(entries), []
+    if any("x" in e and "y" in e and "action" in e for e in entries):
+        return "touch_log", stage, touch_gesture_rows(entries), []
+    return None
+
+
+# -------------------- Indexing --------------------
+
+def iter_candidates(roots: Sequence[Path], db_path: Path) -> Iterator[Path]:
+    for root in roots:
+        if root.is_file():
+            yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".") and d not in SKIPPED_DIRS]
+            for name in filenames:
+                path = Path(dirpath) / name
+                if path.suffix.lower() in INDEXED_SUFFIXES and not name.startswith(".") and path != db_path:
+                    yield path
+
+
+def index_paths(conn: sqlite3.Connection, roots: Sequence[Path], db_path: Path) -> Dict[str, int]:
+    known = {row[0]: (row[1], row[2], row[3]) for row in conn.execute("SELECT path, id, size, mtime_ns FROM files")}
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "skipped": 0, "removed": 0, "errors": 0}
+    seen = set()
+
+    for path in iter_candidates(roots, db_path):
+        key = str(path.resolve())
+        seen.add(key)
+        stat = path.stat()
+        previous = known.get(key)
+        if previous and previous[1] == stat.st_size and previous[2] == stat.st_mtime_ns:
+            counts["unchanged"] += 1
+            continue
+        try:
+            extracted = extract(path)
+        except (OSError, ValueError, ET.ParseError, KeyError, TypeError) as exc:
+            print(f"Skipping {path}: {exc}", file=sys.stderr)
+            counts["errors"] += 1
+            extracted = None
+        if previous:
+            conn.execute("DELETE FROM files WHERE id = ?", (previous[0],))
+        if extracted is None:
+            # Remember unrelated files too, so later runs skip them on stat alone.
+            extracted = ("other", None, [], [])
+            counts["skipped"] += 1
+        else:
+            counts["updated" if previous else "added"] += 1
+
+        kind, stage, gestures, nodes = extracted
+        cursor = conn.execute(
+            "INSERT INTO files (path, kind, size, mtime_ns, stage, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, kind, stat.st_size, stat.st_mtime_ns, stage, time.time()),
+        )
+        file_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO gestures (file_id, seq, serial, kind, start_ts, duration, start_x, start_y, end_x, end_y,"
+            " min_x, min_y, max_x, max_y, resource_id, text, class, value)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(file_id,) + row for row in gestures],
+        )
+        conn.executemany(
+            "INSERT INTO nodes (file_id, resource_id, text, class, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(file_id,) + row for row in nodes],
+        )
+
+    scanned = [str(r.resolve()) for r in roots]
+    for path, (file_id, _, _) in known.items():
+        under_root = any(path == r or path.startswith(r.rstrip("/") + "/") for r in scanned)
+        if under_root and path not in seen:
+            conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            counts["removed"] += 1
+
+    conn.commit()
+    return counts
+
+
+# -------------------- Queries --------------------
+
+def _match(column: str, value: str) -> Tuple[str, str]:
+    return (f"{column} LIKE ?", value) if "%" in value else (f"{column} = ?", value)
+
+
+def query_gestures(conn: sqlite3.Connection, args: argparse.Namespace) -> List[sqlite3.Row]:
+    clauses: List[str] = []
+    params: List[object] = []
+    if args.kind:
+        clauses.append("g.kind = ?")
+        params.append(args.kind)
+    if args.region:
+        x1, y1, x2, y2 = args.region
+        if args.within:
+            clauses.append("g.min_x >= ? AND g.max_x <= ? AND g.min_y >= ? AND g.max_y <= ?")
+            params += [x1, x2, y1, y2]
+        else:
+            clauses.append("g.max_x >= ? AND g.min_x <= ? AND g.max_y >= ? AND g.min_y <= ?")
+            params += [x1, x2, y1, y2]
+    filters = (
+        ("g.resource_id", args.resource_id),
+        ("g.text", args.text),
+        ("g.serial", args.serial),
+        ("f.stage", args.stage),
+    )
+    for column, value in filters:
+        if value:
+            clause, param = _match(column, value)
+            clauses.append(clause)
+            params.append(param)
+    if args.min_duration is not None:
+        clauses.append("g.duration >= ?")
+        params.append(args.min_duration)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    if args.files:
+        sql = (
+            "SELECT f.path, f.kind, f.stage, COUNT(*) AS matches"
+            f" FROM gestures g JOIN files f ON f.id = g.file_id {where}"
+            " GROUP BY f.id ORDER BY f.path LIMIT ?"
+        )
+    else:
+        sql = (
+            "SELECT f.path, g.seq, g.serial, g.kind, g.start_x, g.start_y, g.end_x, g.end_y, g.duration,"
+            f" g.resource_id, g.text, g.value FROM gestures g JOIN files f ON f.id = g.file_id {where}"
+            " ORDER BY f.path, g.seq LIMIT ?"
+        )
+    return conn.execute(sql, params + [args.limit]).fetchall()
+
+
+def query_nodes(conn: sqlite3.Connection, args: argparse.Namespace) -> List[sqlite3.Row]:
+    clauses: List[str] = []
+    params: List[object] = []
+    filters = (
+        ("n.resource_id", args.resource_id),
+        ("n.text", args.text),
+        ("n.class", args.node_class),
+        ("f.stage", args.stage),
+    )
+    for column, value in filters:
+        if value:
+            clause, param = _match(column, value)
+            clauses.append(clause)
+            params.append(param)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = (
+        "SELECT f.path, f.stage, n.resource_id, n.text, n.class, n.x1, n.y1, n.x2, n.y2"
+        f" FROM nodes n JOIN files f ON f.id = n.file_id {where} ORDER BY f.path LIMIT ?"
+    )
+    return conn.execute(sql, params + [args.limit]).fetchall()
+
+
+# -------------------- CLI --------------------
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Index and search recorded sessions in SQLite")
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help="Index database (default: %(default)s)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    index = sub.add_parser("index", help="Ingest new or changed logs and dumps")
+    index.add_argument(
+        "roots", type=Path, nargs="*", default=[DEFAULT_ROOT], help="Files/directories (default: /work)"
+    )
+
+    gestures = sub.add_parser("gestures", help="Search gestures")
+    gestures.add_argument("--kind", choices=["tap", "swipe", "key", "text"])
+    gestures.add_argument(
+        "--region",
+        type=int,
+        nargs=4,
+        metavar=("X1", "Y1", "X2", "Y2"),
+        help="Gesture box intersects region",
+    )
+    gestures.add_argument("--within", action="store_true", help="Require the gesture box to lie inside --region")
+    gestures.add_argument("--min-duration", type=float, help="Minimum gesture duration in seconds")
+    gestures.add_argument(
+        "--files", action="store_true", help="List matching files with match counts instead of gestures"
+    )
+
+    nodes = sub.add_parser("nodes", help="Search UI dump nodes")
+    nodes.add_argument("--class", dest="node_class")
+
+    for query in (gestures, nodes):
+        query.add_argument("--resource-id", help="Exact match, or a LIKE pattern when it contains %%")
+        query.add_argument("--text", help="Exact match, or a LIKE pattern when it contains %%")
+        query.add_argument("--stage")
+        query.add_argument("--limit", type=int, default=200)
+    gestures.add_argument("--serial")
+
+    sub.add_parser("stats", help="Show what the index contains")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    conn = connect(args.db)
+    conn.row_factory = sqlite3.Row
+    started = time.perf_counter()
+
+    if args.command == "index":
+        counts = index_paths(conn, args.roots, args.db.resolve())
+        summary = ", ".join(f"{k}={v}" for k, v in counts.items())
+        print(f"Indexed in {time.perf_counter() - started:.2f}s: {summary}")
+        return 0
+
+    if args.command == "stats":
+        for row in conn.execute("SELECT kind, COUNT(*) FROM files GROUP BY kind ORDER BY kind"):
+            print(f"{row[0]}: {row[1]} files")
+        for table in ("gestures", "nodes"):
+            print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} rows")
+        return 0
+
+    rows = query_gestures(conn, args) if args.command == "gestures" else query_nodes(conn, args)
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in tuple(row)))
+    print(f"{len(rows)} rows in {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
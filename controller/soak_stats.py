@@ -0,0 +1,131 @@
+"""
+Constant-memory latency statistics for long replay soaks.
+
+`LatencyHistogram` is an HDR-style log-linear histogram: values (recorded in
+microseconds) below 64 are counted exactly, larger values keep their top six
+significant bits, giving ~3% relative error over 1 us .. ~50 days in a fixed
+array of 1,216 counters. `SoakStats` keeps one pair of histograms (adb latency
+and end-to-end step duration) per step label and periodically writes a JSON
+snapshot of p50/p99/max.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_SHIFT = 36
+BUCKET_COUNT = 2 * SUB_BUCKETS + MAX_SHIFT * SUB_BUCKETS
+MAX_VALUE_US = (2 * SUB_BUCKETS << MAX_SHIFT) - 1
+
+
+class LatencyHistogram:
+    def __init__(self) -> None:
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    @staticmethod
+    def bucket_index(value_us: int) -> int:
+        if value_us < 2 * SUB_BUCKETS:
+            return value_us
+        shift = value_us.bit_length() - (SUB_BUCKET_BITS + 1)
+        return 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + ((value_us >> shift) - SUB_BUCKETS)
+
+    @staticmethod
+    def bucket_bounds(index: int) -> tuple[int, int]:
+        if index < 2 * SUB_BUCKETS:
+            return index, index
+        shift = (index - 2 * SUB_BUCKETS) // SUB_BUCKETS + 1
+        low = ((index - 2 * SUB_BUCKETS) % SUB_BUCKETS + SUB_BUCKETS) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value_us = min(MAX_VALUE_US, max(0, int(seconds * 1_000_000)))
+        self.counts[self.bucket_index(value_us)] += 1
+        self.total += 1
+        self.max_us = max(self.max_us, value_us)
+        self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+
+    def percentile(self, pct: float) -> float:
+        """Return the value (seconds) at `pct`, within the bucket's relative error."""
+        if self.total == 0:
+            return 0.0
+        target = max(1, math.ceil(self.total * pct / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                low, high = self.bucket_bounds(index)
+                return min((low + high) / 2, self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.total,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(self.max_us / 1000, 3),
+        }
+
+
+class SoakStats:
+    def __init__(self, output: Optional[Path], interval: float) -> None:
+        self.output = output
+        self.interval = interval
+        self.started = time.time()
+        self.iterations = 0
+        self.adb: Dict[str, LatencyHistogram] = {}
+        self.step: Dict[str, LatencyHistogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.retries: Dict[str, int] = {}
+        self._last_write = time.monotonic()
+
+    def record(self, label: str, adb_seconds: Optional[float], step_seconds: float) -> None:
+        if adb_seconds is not None:
+            self.adb.setdefault(label, LatencyHistogram()).record(adb_seconds)
+        self.step.setdefault(label, LatencyHistogram()).record(step_seconds)
+
+    def record_retry(self, label: str) -> None:
+        self.retries[label] = self.retries.get(label, 0) + 1
+
+    def record_error(self, label: str) -> None:
+        self.errors[label] = self.errors.get(label, 0) + 1
+
+    def snapshot(self) -> Dict[str, object]:
+        labels = sorted(set(self.step) | set(self.errors), key=lambda l: (len(l), l))
+        return {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "elapsed_s": round(time.time() - self.started, 1),
+            "iterations": self.iterations,
+            "errors": sum(self.errors.values()),
+            "steps": {
+                label: {
+                    "adb": self.adb[label].summary() if label in self.adb else None,
+                    "step": self.step[label].summary() if label in self.step else None,
+                    "retries": self.retries.get(label, 0),
+                    "errors": self.errors.get(label, 0),
+                }
+                for label in labels
+            },
+        }
+
+    def write(self) -> None:
+        self._last_write = time.monotonic()
+        if self.output is None:
+            return
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.output.with_name(f".{self.output.name}.tmp")
+        tmp_path.write_text(json.dumps(self.snapshot(), indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.output)
+
+    def maybe_write(self) -> None:
+        if time.monotonic() - self._last_write >= self.interval:
+            self.write()
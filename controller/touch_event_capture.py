@@ -8,24 +8,59 @@ The script listens for `ABS_MT_POSITION_X`, `ABS_MT_POSITION_Y`, and
 It is designed to run inside the Docker `controller` container where `/work`
 is mounted to the host, allowing the output file to be accessible directly on
 the host machine.
+
+With `--element-log`, a background worker takes a UI hierarchy snapshot when
+capture starts and again after every `up` (requests arriving while a dump is
+running are coalesced into the next one). Each gesture is resolved against the
+latest snapshot that had finished when its `down` arrived, i.e. the screen the
+finger actually touched, and written to a combined log that `replay_log.py` can replay by element identity,
+falling back to the recorded coordinates. getevent reports digitizer values,
+while UI bounds and `input tap` use display pixels, so `--element-log` turns on
+`--display-coords`; without a device profile the two are assumed to match.
+
+With `--serials`, getevent runs on several devices at once (asyncio
+subprocesses, one parser per device). getevent stamps events with the device's
+CLOCK_MONOTONIC, so every line is also stamped with the host time it arrived;
+the smallest (arrival - event time) difference from that point on is taken as
+the device's offset (`apply_clock_offsets`). The events are written as one
+time-ordered stream with host timestamps and a `serial` column.
+
+Without `--device`, the touchscreen is taken from the cached device profile
+(`device_profile.py`), so getevent only streams the panel's events. With
+`--display-coords`, digitizer values are mapped to display pixels using the
+profile's ABS ranges for panels whose resolution differs from the screen.
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
 import csv
+import heapq
 import json
 import re
 import subprocess
 import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from device_profile import ProfileError, load_profile
+from replay_log import collapse_touch_events, group_touch_events
+from ui_dump_capture import parse_nodes
 
 EVENT_PATTERN = re.compile(
-    r"\[\s*(\d+\.\d+)\]\s+(\S+):\s+(\S+)\s+(\S+)\s+([0-9a-fA-F]+)"
+    r"\[\s*(\d+\.\d+)\]\s+(?:(\S+):\s+)?(\S+)\s+(\S+)\s+([0-9a-fA-F]+)"
 )
 POSITION_CODES = {"ABS_MT_POSITION_X", "ABS_MT_POSITION_Y"}
 DEFAULT_OUTPUT = "/work/touch-events.json"
+DEFAULT_ELEMENT_LOG = "/work/touch-elements.json"
+DEFAULT_FIELDS = ["timestamp", "x", "y", "action"]
+
+Node = Dict[str, object]
+CoordinateMap = Callable[[int, int], Tuple[int, int]]
 
 
 def parse_args() -> argparse.Namespace:
@@ -50,13 +85,38 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument(
         "-d",
         "--device",
-        help="Target input device path (e.g., /dev/input/event2)",
+        help="Target input device path (default: the touchscreen from the device profile)",
+    )
+    parser.add_argument(
+        "--display-coords",
+        action="store_true",
+        help="Convert digitizer values to display pixels using the device profile's ABS ranges",
     )
     parser.add_argument(
         "-s",
         "--serial",
         help="ADB serial to target a specific device",
     )
+    parser.add_argument(
+        "-e",
+        "--element-log",
+        nargs="?",
+        const=DEFAULT_ELEMENT_LOG,
+        help=(
+            "Also snapshot the UI at start and after each touch-up, and write gestures with the "
+            f"element under the finger to this JSON file (default: {DEFAULT_ELEMENT_LOG})"
+        ),
+    )
+    parser.add_argument(
+        "-m",
+        "--serials",
+        nargs="+",
+        metavar="SERIAL[@DEVICE]",
+        help=(
+            "Capture several devices concurrently into one merged, time-ordered log. "
+            "Append @/dev/input/eventN to pick a device's touchscreen."
+        ),
+    )
     return parser.parse_args()
 
 
@@ -77,49 +137,341 @@ def build_adb_command(args: argparse.Namespace) -> List[str]:
     return cmd
 
 
-def parse_stream(lines: Iterable[str], device_filter: Optional[str]) -> List[Dict[str, object]]:
-    events: List[Dict[str, object]] = []
-    last_x: Optional[int] = None
-    last_y: Optional[int] = None
-    pending_update = False
-    active = False
+class TouchParser:
+    """Incremental `getevent -lt` parser that turns SYN reports into touch actions.
 
-    for line in lines:
+    `getevent -lt DEVICE` omits the `/dev/input/eventN:` column, so lines
+    without it are accepted and attributed to the streamed device:
+
+    >>> parser = TouchParser("/dev/input/event2")
+    >>> parser.feed("[   74965.123456] EV_ABS       ABS_MT_POSITION_X    0000021c")
+    >>> parser.feed("[   74965.123456] EV_ABS       ABS_MT_POSITION_Y    00000400")
+    >>> parser.feed("[   74965.123456] EV_SYN       SYN_REPORT           00000000")
+    {'timestamp': 74965.123456, 'x': 540, 'y': 1024, 'action': 'down'}
+    >>> parser.feed("[   74965.200000] /dev/input/event3: EV_SYN SYN_REPORT 00000000")
+    """
+
+    def __init__(self, device_filter: Optional[str], to_display: Optional[CoordinateMap] = None) -> None:
+        self.device_filter = device_filter
+        self.to_display = to_display
+        self.last_x: Optional[int] = None
+        self.last_y: Optional[int] = None
+        self.pending_update = False
+        self.active = False
+
+    def feed(self, line: str) -> Optional[Dict[str, object]]:
         match = EVENT_PATTERN.match(line.strip())
         if not match:
-            continue
+            return None
 
         timestamp_raw, device, ev_type, code, value_hex = match.groups()
-        if device_filter and device != device_filter:
-            continue
+        if self.device_filter and device and device != self.device_filter:
+            return None
 
         if ev_type == "EV_ABS" and code in POSITION_CODES:
             value = int(value_hex, 16)
             if code == "ABS_MT_POSITION_X":
-                last_x = value
+                self.last_x = value
             else:
-                last_y = value
-            pending_update = True
-            continue
+                self.last_y = value
+            self.pending_update = True
+            return None
+
+        if ev_type != "EV_SYN" or code != "SYN_REPORT":
+            return None
 
-        if ev_type == "EV_SYN" and code == "SYN_REPORT":
-            timestamp = float(timestamp_raw)
-            if pending_update and last_x is not None and last_y is not None:
-                action = "down" if not active else "move"
-                active = True
-                events.append(
-                    {"timestamp": timestamp, "x": last_x, "y": last_y, "action": action}
-                )
-            elif active:
-                events.append(
-                    {"timestamp": timestamp, "x": last_x, "y": last_y, "action": "up"}
-                )
-                active = False
-            pending_update = False
+        timestamp = float(timestamp_raw)
+        event: Optional[Dict[str, object]] = None
+        if self.pending_update and self.last_x is not None and self.last_y is not None:
+            action = "down" if not self.active else "move"
+            self.active = True
+            event = {"timestamp": timestamp, "x": self.last_x, "y": self.last_y, "action": action}
+        elif self.active:
+            event = {"timestamp": timestamp, "x": self.last_x, "y": self.last_y, "action": "up"}
+            self.active = False
+        self.pending_update = False
+        if event is not None and self.to_display is not None:
+            event["x"], event["y"] = self.to_display(event["x"], event["y"])  # type: ignore[arg-type]
+        return event
 
+
+def parse_stream(
+    lines: Iterable[str],
+    device_filter: Optional[str],
+    events: Optional[List[Dict[str, object]]] = None,
+    on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    to_display: Optional[CoordinateMap] = None,
+) -> List[Dict[str, object]]:
+    """Parse getevent output, appending to `events` as it goes so an interrupt keeps them."""
+    events = [] if events is None else events
+    parser = TouchParser(device_filter, to_display)
+    for line in lines:
+        event = parser.feed(line)
+        if event is None:
+            continue
+        events.append(event)
+        if on_event:
+            on_event(event)
     return events
 
 
+def resolve_device(
+    serial: Optional[str], device: Optional[str], display_coords: bool
+) -> Tuple[Optional[str], Optional[CoordinateMap]]:
+    """Fill in the touchscreen and coordinate mapping from the cached device profile."""
+    if device and not display_coords:
+        return device, None
+    try:
+        profile = load_profile(serial)
+    except (ProfileError, OSError) as exc:
+        print(f"[{serial or 'default'}] device profile unavailable ({exc}); using raw getevent values.", file=sys.stderr)
+        return device, None
+    to_display = profile.to_display if display_coords and profile.needs_scaling else None
+    return device or profile.touch_device, to_display
+
+
+# -------------------- UI snapshots --------------------
+
+class SnapshotWorker(threading.Thread):
+    """Take UI dumps off the getevent thread, coalescing requests made while one runs.
+
+    The first dump is taken as soon as the worker starts; later ones follow
+    `request()` (sent on every touch-up). `mark_down()` records how many dumps
+    had finished when a touch-down arrived, so each gesture is resolved against
+    the screen as it was before the finger landed rather than the one it led to.
+    """
+
+    def __init__(self, serial: Optional[str]) -> None:
+        super().__init__(daemon=True)
+        self.serial = serial
+        self.snapshots: List[List[Node]] = []
+        self.down_marks: List[int] = []
+        self._cond = threading.Condition()
+        self._requested = 1  # the initial snapshot
+        self._stopping = False
+
+    def request(self) -> None:
+        with self._cond:
+            self._requested += 1
+            self._cond.notify()
+
+    def mark_down(self) -> None:
+        self.down_marks.append(len(self.snapshots))
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self.join()
+
+    def run(self) -> None:
+        served = 0
+        while True:
+            with self._cond:
+                while self._requested == served and not self._stopping:
+                    self._cond.wait()
+                if self._requested == served:
+                    return
+                target = self._requested
+            nodes = self._dump()
+            if nodes is not None:
+                self.snapshots.append(nodes)
+            served = target
+
+    def _dump(self) -> Optional[List[Node]]:
+        cmd = ["adb"] + (["-s", self.serial] if self.serial else [])
+        cmd += ["exec-out", "uiautomator", "dump", "/dev/tty"]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        end = result.stdout.rfind("</hierarchy>")
+        if result.returncode != 0 or end < 0:
+            print(f"UI snapshot failed: {result.stderr.strip() or 'no hierarchy'}", file=sys.stderr)
+            return None
+        try:
+            return parse_nodes(ET.fromstring(result.stdout[: end + len("</hierarchy>")]))
+        except ET.ParseError as exc:
+            print(f"UI snapshot unparsable: {exc}", file=sys.stderr)
+            return None
+
+    def snapshot_before(self, down: int) -> Optional[List[Node]]:
+        """Latest snapshot finished before touch-down number `down` (1-based) arrived."""
+        finished = self.down_marks[down - 1] if down <= len(self.down_marks) else 0
+        return self.snapshots[finished - 1] if finished else None
+
+
+def make_snapshot_trigger(worker: SnapshotWorker) -> Callable[[Dict[str, object]], None]:
+    def trigger(event: Dict[str, object]) -> None:
+        if event["action"] == "down":
+            worker.mark_down()
+        elif event["action"] == "up":
+            worker.request()
+
+    return trigger
+
+
+def hit_test(nodes: List[Node], x: int, y: int) -> Optional[Node]:
+    """Return the smallest node containing (x, y), preferring nodes with an id or text."""
+    best: Optional[Tuple[bool, int, Node]] = None
+    for node in nodes:
+        bounds = node.get("bounds") or {}
+        x1, y1, x2, y2 = (bounds.get(k) for k in ("x1", "y1", "x2", "y2"))  # type: ignore[union-attr]
+        if None in (x1, y1, x2, y2) or not (x1 <= x < x2 and y1 <= y < y2):
+            continue
+        anonymous = not (node.get("resource_id") or node.get("text"))
+        key = (anonymous, (x2 - x1) * (y2 - y1), node)
+        if best is None or key[:2] < best[:2]:
+            best = key
+    return best[2] if best else None
+
+
+def build_element_log(events: List[Dict[str, object]], worker: SnapshotWorker) -> List[Dict[str, object]]:
+    entries: List[Dict[str, object]] = []
+    downs = 0
+    for group, gesture in zip(group_touch_events(events), collapse_touch_events(events)):
+        nodes: Optional[List[Node]] = None
+        if group[0].get("action") == "down":
+            downs += 1
+            nodes = worker.snapshot_before(downs)
+        entry: Dict[str, object] = {
+            "timestamp": gesture.start_ts,
+            "action": gesture.kind,
+            "x": gesture.start_x,
+            "y": gesture.start_y,
+            "end_x": gesture.end_x,
+            "end_y": gesture.end_y,
+            "duration": round(gesture.end_ts - gesture.start_ts, 6),
+        }
+        # Without a snapshot from before the touch, keep the coordinates only.
+        node = hit_test(nodes, gesture.start_x, gesture.start_y) if nodes else None
+        if node:
+            for key in ("resource_id", "text", "class", "bounds"):
+                if node.get(key):
+                    entry[key] = node[key]
+        entries.append(entry)
+    return entries
+
+
+# -------------------- Multi-device capture --------------------
+
+def parse_target(target: str, default_device: Optional[str]) -> Tuple[str, Optional[str]]:
+    serial, sep, device = target.rpartition("@")
+    return (serial, device or default_device) if sep else (target, default_device)
+
+
+async def capture_device(
+    serial: str,
+    device: Optional[str],
+    sink: List[Dict[str, object]],
+    to_display: Optional[CoordinateMap] = None,
+) -> None:
+    cmd = ["adb", "-s", serial, "shell", "getevent", "-lt"] + ([device] if device else [])
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    parser = TouchParser(device, to_display)
+    try:
+        assert proc.stdout is not None
+        async for raw in proc.stdout:
+            received = time.time()
+            event = parser.feed(raw.decode("utf-8", errors="replace"))
+            if event is None:
+                continue
+            sink.append(
+                {
+                    "timestamp": None,  # filled in by apply_clock_offsets
+                    "serial": serial,
+                    "x": event["x"],
+                    "y": event["y"],
+                    "action": event["action"],
+                    "device_timestamp": event["timestamp"],
+                    "_received": received,
+                }
+            )
+    finally:
+        if proc.returncode is None:
+            proc.terminate()
+            await proc.wait()
+        if proc.stderr:
+            try:
+                stderr_raw = await asyncio.wait_for(proc.stderr.read(), timeout=1.0)
+            except asyncio.TimeoutError:
+                stderr_raw = b""
+            stderr_output = stderr_raw.decode(errors="replace").strip()
+            if stderr_output:
+                print(f"[{serial}] {stderr_output}", file=sys.stderr)
+
+
+async def capture_many(
+    targets: List[Tuple[str, Optional[str], Optional[CoordinateMap]]],
+    per_device: Dict[str, List[Dict[str, object]]],
+) -> None:
+    for serial, device, _ in targets:
+        print(f"[{serial}] device {device or 'all'}", file=sys.stderr)
+    print("Press Ctrl+C to stop capturing and write the merged output file.", file=sys.stderr)
+    await asyncio.gather(
+        *(capture_device(serial, device, per_device[serial], to_display) for serial, device, to_display in targets)
+    )
+
+
+def apply_clock_offsets(events: List[Dict[str, object]]) -> Optional[Tuple[float, float]]:
+    """Convert device timestamps to host time; return the first and last offset used.
+
+    Arrival time minus event time is the clock offset plus the adb transport
+    delay, so the minimum over many events approaches the offset. The minimum is
+    taken over the events from each point onward because the offset only grows:
+    while a device is suspended its CLOCK_MONOTONIC stops but the host clock does
+    not, and buffered lines only ever arrive late.
+    """
+    best = float("inf")
+    for event in reversed(events):
+        device_ts = float(event["device_timestamp"])  # type: ignore[arg-type]
+        best = min(best, float(event.pop("_received")) - device_ts)  # type: ignore[arg-type]
+        event["timestamp"] = round(device_ts + best, 6)
+    if not events:
+        return None
+    first, last = events[0], events[-1]
+    return (
+        float(first["timestamp"]) - float(first["device_timestamp"]),  # type: ignore[arg-type]
+        float(last["timestamp"]) - float(last["device_timestamp"]),  # type: ignore[arg-type]
+    )
+
+
+def merge_device_events(per_device: Dict[str, List[Dict[str, object]]]) -> List[Dict[str, object]]:
+    # Each device stream is already in order; heapq.merge keeps the merge linear.
+    return list(heapq.merge(*per_device.values(), key=lambda e: float(e["timestamp"])))  # type: ignore[arg-type]
+
+
+def run_multi_capture(args: argparse.Namespace, output_path: Path, output_format: str) -> int:
+    targets = [
+        (serial, *resolve_device(serial, device, args.display_coords))
+        for serial, device in (parse_target(target, args.device) for target in args.serials)
+    ]
+    per_device: Dict[str, List[Dict[str, object]]] = {serial: [] for serial, _, _ in targets}
+    try:
+        asyncio.run(capture_many(targets, per_device))
+    except KeyboardInterrupt:
+        print("\nStopping capture...", file=sys.stderr)
+    except FileNotFoundError:
+        print("adb not found. Ensure Android platform tools are installed in the container.", file=sys.stderr)
+        return 1
+
+    for serial, items in per_device.items():
+        offsets = apply_clock_offsets(items)
+        if offsets is None:
+            continue
+        first, last = offsets
+        note = f" (grew by {last - first:.3f}s: device slept or output was delayed)" if last - first > 0.5 else ""
+        print(f"[{serial}] clock offset {first:.3f}s{note}", file=sys.stderr)
+
+    events = merge_device_events(per_device)
+    write_output(events, output_path, output_format)
+    counts = ", ".join(f"{serial}={len(items)}" for serial, items in per_device.items())
+    print(
+        f"Saved {len(events)} merged events ({counts}) to {output_path} ({output_format.upper()}).",
+        file=sys.stderr,
+    )
+    return 0
+
+
 def write_output(events: List[Dict[str, object]], output_path: Path, fmt: str) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
     if fmt == "json":
@@ -127,7 +479,7 @@ def write_output(events: List[Dict[str, object]], output_path: Path, fmt: str) -
         return
 
     with output_path.open("w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=["timestamp", "x", "y", "action"])
+        writer = csv.DictWriter(csvfile, fieldnames=list(events[0]) if events else DEFAULT_FIELDS)
         writer.writeheader()
         writer.writerows(events)
 
@@ -136,8 +488,24 @@ def main() -> int:
     args = parse_args()
     output_path = Path(args.output).expanduser()
     output_format = infer_format(output_path, args.format)
+    if args.serials:
+        if args.element_log:
+            print("--element-log is not supported together with --serials.", file=sys.stderr)
+            return 1
+        return run_multi_capture(args, output_path, output_format)
+
+    # Hit-testing compares against UI bounds, which are in display pixels.
+    display_coords = args.display_coords or bool(args.element_log)
+    args.device, to_display = resolve_device(args.serial, args.device, display_coords)
     adb_cmd = build_adb_command(args)
     events: List[Dict[str, object]] = []
+    worker: Optional[SnapshotWorker] = None
+    on_event: Optional[Callable[[Dict[str, object]], None]] = None
+
+    if args.element_log:
+        worker = SnapshotWorker(args.serial)
+        worker.start()
+        on_event = make_snapshot_trigger(worker)
 
     print(f"Running: {' '.join(adb_cmd)}", file=sys.stderr)
     print("Press Ctrl+C to stop capturing and write the output file.", file=sys.stderr)
@@ -154,7 +522,7 @@ def main() -> int:
                 raise RuntimeError("Failed to open adb stdout stream")
 
             try:
-                events = parse_stream(proc.stdout, args.device)
+                parse_stream(proc.stdout, args.device, events, on_event, to_display)
             except KeyboardInterrupt:
                 print("\nStopping capture...", file=sys.stderr)
             finally:
@@ -174,8 +542,20 @@ def main() -> int:
 
     write_output(events, output_path, output_format)
     print(f"Saved {len(events)} events to {output_path} ({output_format.upper()}).", file=sys.stderr)
+
+    if worker is not None:
+        print("Waiting for pending UI snapshots...", file=sys.stderr)
+        worker.stop()
+        element_path = Path(args.element_log).expanduser()
+        entries = build_element_log(events, worker)
+        write_output(entries, element_path, "json")
+        resolved = sum(1 for e in entries if e.get("resource_id") or e.get("text"))
+        print(
+            f"Saved {len(entries)} gestures ({resolved} resolved to elements) to {element_path}.",
+            file=sys.stderr,
+        )
     return 0
 
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -11,6 +11,8 @@ Features:
 - Stores data for quick lookup by resource-id or text alongside the center
   coordinates for replaying touch events.
 - Tags every dump with a timestamp and an optional stage identifier.
+- With `--keep-xml --store`, the kept XML goes into the content-addressed artifact store
+  instead of a file next to the output.
 """
 
 from __future__ import annotations
@@ -26,6 +28,8 @@ import xml.etree.ElementTree as ET
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 
+from artifact_store import DEFAULT_STORE, ArtifactStore
+
 BOUNDS_PATTERN = re.compile(r"\[(\d+),(\d+)\]\[(\d+),(\d+)\]")
 DEFAULT_OUTPUT = "/work/ui-dump.json"
 REMOTE_XML_PATH = "/sdcard/window_dump.xml"
@@ -62,7 +66,20 @@ def parse_args() -> argparse.Namespace:
             "temporary copy"
         ),
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--store",
+        type=Path,
+        nargs="?",
+        const=DEFAULT_STORE,
+        help=(
+            "With --keep-xml, keep the XML in the artifact store "
+            f"(default root: {DEFAULT_STORE}) instead of next to the output"
+        ),
+    )
+    args = parser.parse_args()
+    if args.store and not args.keep_xml:
+        parser.error("--store requires --keep-xml")
+    return args
 
 
 def adb_base(serial: Optional[str]) -> List[str]:
@@ -182,7 +199,12 @@ def main() -> int:
             nodes = parse_nodes(root)
             payload = build_output(nodes, args.stage, pulled_path)
 
-            if args.keep_xml:
+            if args.keep_xml and args.store:
+                store = ArtifactStore(args.store)
+                ref = store.put_file(f"{output_path.parent.name}/{output_path.stem}.xml", pulled_path)
+                payload["source_xml"] = ref.name
+                payload["source_store"] = str(store.root)
+            elif args.keep_xml:
                 xml_target = output_path.with_suffix(".xml")
                 xml_target.write_text(pulled_path.read_text(encoding="utf-8"), encoding="utf-8")
                 payload["source_xml"] = str(xml_target)
@@ -201,4 +223,4 @@ def main() -> int:
 
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Compare a replay verification directory against a known-good (golden) run.
+
+Features
+- Pairs ``stepNNN-*.png`` / ``stepNNN-*.xml`` files written by
+  ``replay-log.py --verify`` with the same step in the golden directory.
+- Screenshots: 64-bit DCT perceptual hash plus a downscaled, masked NumPy diff.
+  Masks are fractional ``x1,y1,x2,y2`` regions (default: the status bar, where
+  the clock and notification icons live).
+- UI dumps: structural comparison of the node tree (depth, class and
+  resource-id by default), ignoring text and bounds.
+- Steps are checked across a process pool; golden hashes/thumbnails are cached
+  in ``<golden>/.golden-cache`` so repeated checks only decode the new run.
+- Prints a per-step PASS/FAIL report, writes it as JSON, and exits non-zero on
+  any failure.
+"""
+
+from __future__ import annotations
+
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+STEP_PATTERN = re.compile(r"^step(\d+)-")
+DEFAULT_MASKS = ((0.0, 0.0, 1.0, 0.05),)
+CACHE_DIR_NAME = ".golden-cache"
+HASH_SIZE = 8
+HASH_SOURCE = 32
+PIXEL_TOLERANCE = 0.1
+
+Mask = Tuple[float, float, float, float]
+
+
+@dataclass(frozen=True)
+class CompareOptions:
+    downscale: int = 8
+    masks: Tuple[Mask, ...] = DEFAULT_MASKS
+    phash_threshold: int = 6
+    max_diff: float = 0.01
+    xml_attrs: Tuple[str, ...] = ("class", "resource-id")
+
+
+@dataclass
+class StepPair:
+    step: int
+    actual_png: Optional[Path] = None
+    actual_xml: Optional[Path] = None
+    golden_png: Optional[Path] = None
+    golden_xml: Optional[Path] = None
+
+
+@dataclass
+class StepResult:
+    step: int
+    passed: bool
+    checks: Dict[str, object] = field(default_factory=dict)
+    reasons: List[str] = field(default_factory=list)
+
+
+# -------------------- Pairing --------------------
+
+def index_steps(directory: Path) -> Dict[int, Dict[str, Path]]:
+    """Map step number -> {".png": path, ".xml": path}, keeping the newest file per kind."""
+    steps: Dict[int, Dict[str, Path]] = {}
+    for path in sorted(directory.iterdir()):
+        match = STEP_PATTERN.match(path.name)
+        if match and path.suffix.lower() in {".png", ".xml"}:
+            steps.setdefault(int(match.group(1)), {})[path.suffix.lower()] = path
+    return steps
+
+
+def pair_steps(actual_dir: Path, golden_dir: Path) -> List[StepPair]:
+    actual = index_steps(actual_dir)
+    golden = index_steps(golden_dir)
+    pairs = []
+    for step in sorted(set(actual) | set(golden)):
+        a, g = actual.get(step, {}), golden.get(step, {})
+        pairs.append(StepPair(step, a.get(".png"), a.get(".xml"), g.get(".png"), g.get(".xml")))
+    return pairs
+
+
+# -------------------- Image comparison --------------------
+
+def _dct_matrix(size: int) -> np.ndarray:
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT = _dct_matrix(HASH_SOURCE)
+
+
+def apply_masks(gray: np.ndarray, masks: Sequence[Mask]) -> np.ndarray:
+    height, width = gray.shape
+    keep = np.ones_like(gray, dtype=bool)
+    for x1, y1, x2, y2 in masks:
+        keep[int(y1 * height) : int(np.ceil(y2 * height)), int(x1 * width) : int(np.ceil(x2 * width))] = False
+    return keep
+
+
+def perceptual_hash(gray: np.ndarray, keep: np.ndarray) -> int:
+    filled = np.where(keep, gray, gray[keep].mean() if keep.any() else 0.0)
+    small = np.asarray(
+        Image.fromarray(filled.astype(np.float32)).resize((HASH_SOURCE, HASH_SOURCE), Image.BILINEAR)
+    )
+    low = (DCT @ small @ DCT.T)[:HASH_SIZE, :HASH_SIZE].flatten()
+    bits = low[1:] > np.median(low[1:])
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def image_features(path: Path, options: CompareOptions) -> Tuple[Tuple[int, int], np.ndarray, int]:
+    """Return (original size, masked-region thumbnail, perceptual hash) for a screenshot."""
+    with Image.open(path) as image:
+        size = image.size
+        factor = max(1, options.downscale)
+        thumb = image.convert("L").reduce(factor) if factor > 1 else image.convert("L")
+        gray = np.asarray(thumb, dtype=np.float32)
+    keep = apply_masks(gray, options.masks)
+    return size, gray, perceptual_hash(gray, keep)
+
+
+def cached_golden_features(path: Path, options: CompareOptions) -> Tuple[Tuple[int, int], np.ndarray, int]:
+    stat = path.stat()
+    signature = f"{stat.st_size}:{stat.st_mtime_ns}:{options.downscale}:{options.masks}"
+    cache_path = path.parent / CACHE_DIR_NAME / f"{path.name}.npz"
+    if cache_path.exists():
+        try:
+            with np.load(cache_path) as cached:
+                if str(cached["signature"]) == signature:
+                    return tuple(cached["size"]), cached["thumb"], int(cached["phash"])  # type: ignore[return-value]
+        except (OSError, KeyError, ValueError):
+            pass
+
+    size, thumb, phash = image_features(path, options)
+    tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.tmp.npz")
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        np.savez(tmp_path, signature=signature, size=np.array(size), thumb=thumb, phash=np.array(phash, dtype=np.uint64))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # read-only golden directory: use the features without caching them
+    return size, thumb, phash
+
+
+def compare_images(actual: Path, golden: Path, options: CompareOptions) -> Tuple[bool, Dict[str, object], List[str]]:
+    a_size, a_thumb, a_hash = image_features(actual, options)
+    g_size, g_thumb, g_hash = cached_golden_features(golden, options)
+    if a_size != g_size:
+        return False, {"size": list(a_size), "golden_size": list(g_size)}, [f"screenshot size {a_size} != {g_size}"]
+
+    keep = apply_masks(g_thumb, options.masks)
+    diff = np.abs(a_thumb - g_thumb)[keep] / 255.0
+    changed = float((diff > PIXEL_TOLERANCE).mean()) if diff.size else 0.0
+    distance = bin(a_hash ^ g_hash).count("1")
+    checks = {"phash_distance": distance, "changed_ratio": round(changed, 5), "mean_diff": round(float(diff.mean()) if diff.size else 0.0, 5)}
+
+    reasons = []
+    if distance > options.phash_threshold:
+        reasons.append(f"perceptual hash distance {distance} > {options.phash_threshold}")
+    if changed > options.max_diff:
+        reasons.append(f"{changed:.2%} of pixels changed (> {options.max_diff:.2%})")
+    return not reasons, checks, reasons
+
+
+# -------------------- XML comparison --------------------
+
+def xml_signature(path: Path, attrs: Sequence[str]) -> List[str]:
+    raw = path.read_text(encoding="utf-8", errors="replace")
+    end = raw.rfind("</hierarchy>")
+    root = ET.fromstring(raw[: end + len("</hierarchy>")] if end >= 0 else raw)
+    lines: List[str] = []
+
+    def walk(node: ET.Element, depth: int) -> None:
+        if node.tag == "node":
+            values = " ".join(f"{a}={node.attrib.get(a, '')}" for a in attrs)
+            lines.append(f"{'  ' * depth}{values}")
+        for child in node:
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return lines
+
+
+def compare_xml(actual: Path, golden: Path, options: CompareOptions) -> Tuple[bool, Dict[str, object], List[str]]:
+    try:
+        a_lines = xml_signature(actual, options.xml_attrs)
+        g_lines = xml_signature(golden, options.xml_attrs)
+    except ET.ParseError as exc:
+        return False, {}, [f"unparsable UI dump: {exc}"]
+    if a_lines == g_lines:
+        return True, {"nodes": len(a_lines)}, []
+    diff = [
+        line
+        for line in difflib.unified_diff(g_lines, a_lines, "golden", "actual", n=0, lineterm="")
+        if line[:1] in "+-" and not line.startswith(("+++", "---"))
+    ]
+    return False, {"nodes": len(a_lines), "golden_nodes": len(g_lines), "diff": diff[:10]}, [
+        f"UI structure differs ({len(diff)} changed node lines)"
+    ]
+
+
+# -------------------- Worker --------------------
+
+def check_step(pair: StepPair, options: CompareOptions) -> StepResult:
+    result = StepResult(step=pair.step, passed=True)
+
+    for kind, actual, golden, compare in (
+        ("screenshot", pair.actual_png, pair.golden_png, compare_images),
+        ("ui", pair.actual_xml, pair.golden_xml, compare_xml),
+    ):
+        if actual is None and golden is None:
+            continue
+        if actual is None or golden is None:
+            result.passed = False
+            result.reasons.append(f"{kind} missing in {'actual run' if actual is None else 'golden run'}")
+            continue
+        try:
+            passed, checks, reasons = compare(actual, golden, options)
+        except (OSError, ValueError) as exc:
+            passed, checks, reasons = False, {}, [f"{kind} could not be compared: {exc}"]
+        result.checks[kind] = checks
+        result.reasons.extend(reasons)
+        result.passed = result.passed and passed
+    return result
+
+
+# -------------------- CLI --------------------
+
+def parse_mask(value: str) -> Mask:
+    try:
+        x1, y1, x2, y2 = (float(v) for v in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Mask must be x1,y1,x2,y2 fractions, got {value!r}")
+    return x1, y1, x2, y2
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare replay verification output with a golden run")
+    parser.add_argument("verify_dir", type=Path, help="Directory written by replay-log.py --verify")
+    parser.add_argument("golden_dir", type=Path, help="Known-good verification directory")
+    parser.add_argument(
+        "--mask",
+        type=parse_mask,
+        action="append",
+        help=(
+            "Region to ignore as x1,y1,x2,y2 fractions of the screen; repeatable "
+            "(default: status bar 0,0,1,0.05)"
+        ),
+    )
+    parser.add_argument(
+        "--downscale",
+        type=int,
+        default=8,
+        help="Reduce screenshots by this factor before diffing (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--phash-threshold",
+        type=int,
+        default=6,
+        help="Maximum perceptual hash Hamming distance (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-diff",
+        type=float,
+        default=0.01,
+        help="Maximum fraction of changed pixels after masking (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--xml-attrs",
+        default="class,resource-id",
+        help="Node attributes compared in UI dumps (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Worker processes (default: CPU count)",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        type=Path,
+        help="JSON report path (default: <verify_dir>/golden-report.json)",
+    )
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    for directory in (args.verify_dir, args.golden_dir):
+        if not directory.is_dir():
+            print(f"Not a directory: {directory}", file=sys.stderr)
+            return 1
+
+    options = CompareOptions(
+        downscale=args.downscale,
+        masks=tuple(args.mask) if args.mask else DEFAULT_MASKS,
+        phash_threshold=args.phash_threshold,
+        max_diff=args.max_diff,
+        xml_attrs=tuple(a.strip() for a in args.xml_attrs.split(",") if a.strip()),
+    )
+    pairs = pair_steps(args.verify_dir, args.golden_dir)
+    if not pairs:
+        print("No stepNNN-* files found to compare.", file=sys.stderr)
+        return 1
+
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        chunksize = max(1, len(pairs) // (max(1, args.jobs) * 4))
+        results = list(pool.map(check_step, pairs, [options] * len(pairs), chunksize=chunksize))
+
+    for result in results:
+        status = "PASS" if result.passed else "FAIL"
+        detail = "; ".join(result.reasons)
+        print(f"step{result.step:03d} {status}{f'  {detail}' if detail else ''}")
+
+    failed = sum(1 for r in results if not r.passed)
+    report_path = args.report or args.verify_dir / "golden-report.json"
+    report_path.write_text(
+        json.dumps(
+            {
+                "verify_dir": str(args.verify_dir),
+                "golden_dir": str(args.golden_dir),
+                "options": asdict(options),
+                "passed": len(results) - failed,
+                "failed": failed,
+                "steps": [asdict(r) for r in results],
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    print(f"{len(results) - failed}/{len(results)} steps passed. Report: {report_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())